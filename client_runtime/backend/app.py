@@ -1,7 +1,7 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
-import asyncpg
+from typing import List, Literal, Optional
 import os
 from datetime import datetime, time, timezone
 import pytz
@@ -9,21 +9,72 @@ import logging
 import logger_config
 from prometheus_client import Counter, Histogram, start_http_server
 import threading
-import time as t
+from contextlib import asynccontextmanager, suppress
+import asyncio
+import cache
+import db
+import feedback_queue
+import metrics_middleware
+import queries
+import serialization
 
 
 logger_config.set_logger()
 logger = logging.getLogger("backend")
 IST = pytz.timezone("Asia/Kolkata")
+# largest page a client may request with ?limit=
+MAX_PAGE_SIZE = int(os.getenv("ARTICLES_MAX_PAGE_SIZE", "1000"))
+# rows fetched per round-trip when streaming with ?stream=true
+STREAM_PREFETCH = int(os.getenv("ARTICLES_STREAM_PREFETCH", "500"))
+# concurrent ?stream=true responses; each holds a pool connection for as long
+# as its client keeps reading, so this stays below DB_POOL_MAX_SIZE to leave
+# connections for every other endpoint
+STREAM_MAX_CONCURRENT = int(os.getenv("ARTICLES_STREAM_MAX_CONCURRENT",
+                                      str(max(1, db.POOL_MAX_SIZE // 2))))
+# number of distinct /articles queries whose results are kept in memory
+ARTICLES_CACHE_MAX_ENTRIES = int(os.getenv("ARTICLES_CACHE_MAX_ENTRIES", "256"))
+# number of distinct /stats queries whose results are kept in memory
+STATS_CACHE_MAX_ENTRIES = int(os.getenv("STATS_CACHE_MAX_ENTRIES", "256"))
+# number of distinct /terms queries whose results are kept in memory
+TERMS_CACHE_MAX_ENTRIES = int(os.getenv("TERMS_CACHE_MAX_ENTRIES", "256"))
+# most terms a client may request from /terms
+MAX_TERMS = int(os.getenv("TERMS_MAX_LIMIT", "1000"))
+# article titles kept in memory for feedback lookups
+TITLE_CACHE_MAX_ENTRIES = int(os.getenv("TITLE_CACHE_MAX_ENTRIES", "4096"))
+# feedback is appended here in batches by a single writer
+FEEDBACK_FILE = os.getenv("FEEDBACK_FILE", "/data/feedback.csv")
+FEEDBACK_BATCH_SIZE = int(os.getenv("FEEDBACK_BATCH_SIZE", "50"))
+FEEDBACK_FLUSH_INTERVAL = float(os.getenv("FEEDBACK_FLUSH_INTERVAL", "2"))
+FEEDBACK_FSYNC = os.getenv("FEEDBACK_FSYNC", "true").lower() == "true"
+# an article's image never changes once ingested, so let clients keep it
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
-app = FastAPI()
 
-# Database config
-DB_HOST = os.getenv("POSTGRES_HOST")
-DB_PORT = os.getenv("POSTGRES_PORT")
-DB_NAME = os.getenv("POSTGRES_DB")
-DB_USER = os.getenv("POSTGRES_USER")
-DB_PASSWORD = os.getenv("POSTGRES_PASSWORD")
+ARTICLES_CACHE = cache.QueryCache("articles", ARTICLES_CACHE_MAX_ENTRIES)
+STATS_CACHE = cache.QueryCache("stats", STATS_CACHE_MAX_ENTRIES)
+TERMS_CACHE = cache.QueryCache("terms", TERMS_CACHE_MAX_ENTRIES)
+# titles never change once ingested, so entries need no invalidation
+TITLE_CACHE = cache.LRUCache(TITLE_CACHE_MAX_ENTRIES)
+STREAM_SLOTS = asyncio.Semaphore(STREAM_MAX_CONCURRENT)
+FEEDBACK_WRITER = feedback_queue.FeedbackWriter(
+    FEEDBACK_FILE, FEEDBACK_BATCH_SIZE, FEEDBACK_FLUSH_INTERVAL, FEEDBACK_FSYNC)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await db.create_pool()
+    FEEDBACK_WRITER.start()
+    listener = asyncio.create_task(cache.listen_for_changes(
+        [ARTICLES_CACHE, STATS_CACHE, TERMS_CACHE]))
+    yield
+    listener.cancel()
+    with suppress(asyncio.CancelledError):
+        await listener
+    await FEEDBACK_WRITER.stop()
+    await db.close_pool()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 # Prometheus metrics
@@ -35,6 +86,18 @@ REQUEST_ERRORS = Counter("api_request_errors_total",
                          "Total number of errors", ["endpoint"])
 
 
+def record_request(route, status, elapsed):
+    """Feed the per-endpoint api_* metrics from the metrics middleware"""
+    REQUEST_COUNT.labels(endpoint=route).inc()
+    REQUEST_LATENCY.labels(endpoint=route).observe(elapsed)
+    if status >= 400:
+        REQUEST_ERRORS.labels(endpoint=route).inc()
+
+
+app.add_middleware(metrics_middleware.PrometheusMiddleware,
+                   on_response=record_request)
+
+
 def start_prometheus_server():
     start_http_server(9000)
 threading.Thread(target=start_prometheus_server, daemon=True).start()
@@ -47,109 +110,172 @@ class Article(BaseModel):
     publication_timestamp: datetime
     article_link: str
     summary: Optional[str]
-    image_base64: Optional[str]
+    image_url: Optional[str]
     sentiment: Optional[int]
 
+class SentimentCount(BaseModel):
+    bucket: datetime
+    sentiment: int
+    count: int
+
+class TermCount(BaseModel):
+    term: str
+    count: int
+
 class Feedback(BaseModel):
     article_id: int
     corrected_sentiment: int
 
 
-# Database connection
-async def connect_db():
-    return await asyncpg.connect(
-        host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASSWORD, port=DB_PORT
-    )
+@app.exception_handler(db.PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: db.PoolTimeout):
+    logger.error(f"{request.url.path}: {exc}")
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
+def parse_date_range(start_date, end_date):
+    """Day range in IST, from 00:00:00 on start_date to 23:59:59 on end_date"""
+    start_datetime = IST.localize(datetime.combine(
+        datetime.strptime(start_date, "%Y-%m-%d"), time(0, 0, 0)))
+    end_datetime = IST.localize(datetime.combine(
+        datetime.strptime(end_date, "%Y-%m-%d"), time(23, 59, 59)))
+    return start_datetime, end_datetime
+
+
+async def stream_articles(query, params):
+    """Yield rows as NDJSON straight off a server-side cursor"""
+    count = 0
+    async with STREAM_SLOTS, db.acquire() as conn:
+        # asyncpg cursors only live inside a transaction
+        async with conn.transaction():
+            async for record in conn.cursor(query, *params, prefetch=STREAM_PREFETCH):
+                count += 1
+                yield serialization.encode_article_line(record)
+    logger.info(f"Streamed {count} articles!")
 
 
 @app.get("/articles", response_model=List[Article])
-async def get_articles(start_date: str, end_date: str, sentiment: Optional[int] = None):
-    endpoint = "/articles"
-    REQUEST_COUNT.labels(endpoint=endpoint).inc()
-    start_time = t.time()
-    try:
-        conn = await connect_db()
-        logger.info("Connected to database!")
-
-        # Parse dates
-        start_datetime = IST.localize(datetime.combine(
-            datetime.strptime(start_date, "%Y-%m-%d"), time(0, 0, 0)))
-        end_datetime = IST.localize(datetime.combine(
-            datetime.strptime(end_date, "%Y-%m-%d"), time(23, 59, 59)))
-
-        # Build query
-        query = """
-            SELECT a.id, a.title, a.publication_timestamp, 
-                a.article_link, a.summary, i.image_base64,
-                a.sentiment
-            FROM articles a
-            LEFT JOIN images i ON a.id = i.article_id
-            WHERE a.publication_timestamp BETWEEN $1 AND $2
-        """
-
-        params = [start_datetime, end_datetime]
-
-        if sentiment is not None:
-            query += " AND a.sentiment = $3"
-            params.append(sentiment)
-
-        query += " ORDER BY a.publication_timestamp DESC"
-
-        rows = await conn.fetch(query, *params)
-        await conn.close()
-
-        articles = []
-        for record in rows:
-            ist_time = record["publication_timestamp"].replace(
-                tzinfo=pytz.utc).astimezone(IST)
-            articles.append(Article(
-                id=record["id"],
-                title=record["title"],
-                publication_timestamp=ist_time,
-                article_link=record["article_link"],
-                summary=record["summary"],
-                image_base64=record["image_base64"],
-                sentiment=record["sentiment"]
-            ))
-
-        logger.info(f"Fetched {len(articles)} articles!")
-        return articles
-    except Exception as e:
-        REQUEST_ERRORS.labels(endpoint=endpoint).inc()
-        raise e
-    finally:
-        REQUEST_LATENCY.labels(endpoint=endpoint).observe(
-            t.time() - start_time)
+async def get_articles(start_date: str, end_date: str, sentiment: Optional[int] = None,
+                       limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                       cursor: Optional[str] = None, stream: bool = False):
+    start_datetime, end_datetime = parse_date_range(start_date, end_date)
+
+    after = None
+    if cursor is not None:
+        try:
+            after = queries.decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    if stream:
+        if STREAM_SLOTS.locked():
+            raise HTTPException(status_code=503, headers={"Retry-After": "1"},
+                                detail=f"{STREAM_MAX_CONCURRENT} article streams already open")
+        query, params = queries.articles_query(
+            start_datetime, end_datetime, sentiment, after, limit)
+        return StreamingResponse(stream_articles(query, params),
+                                 media_type="application/x-ndjson")
+
+    async def load_page():
+        # fetch one extra row to learn whether another page exists
+        query, params = queries.articles_query(
+            start_datetime, end_datetime, sentiment, after,
+            limit + 1 if limit is not None else None)
+
+        async with db.acquire() as conn:
+            rows = await conn.fetch(query, *params)
+
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = queries.encode_cursor(rows[-1])
+        logger.info(f"Fetched {len(rows)} articles!")
+        return serialization.encode_rows(rows), next_cursor
+
+    # the body is encoded once here and served as-is, bypassing
+    # response_model validation, which is kept for the API schema
+    body, next_cursor = await ARTICLES_CACHE.get_or_load(
+        (start_datetime, end_datetime, sentiment, after, limit), load_page)
+    headers = {}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = next_cursor
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.get("/stats", response_model=List[SentimentCount])
+async def get_stats(start_date: str, end_date: str, granularity: Literal["hour", "day"] = "day",
+                    sentiment: Optional[int] = None):
+    start_datetime, end_datetime = parse_date_range(start_date, end_date)
+    # rollup buckets are stored as IST wall-clock hours
+    start_bucket = start_datetime.replace(tzinfo=None)
+    end_bucket = end_datetime.replace(tzinfo=None)
+
+    async def load_stats():
+        query, params = queries.stats_query(
+            start_bucket, end_bucket, granularity, sentiment)
+        async with db.acquire() as conn:
+            rows = await conn.fetch(query, *params)
+        return serialization.encode_rows(rows)
+
+    body = await STATS_CACHE.get_or_load(
+        (start_bucket, end_bucket, granularity, sentiment), load_stats)
+    return Response(content=body, media_type="application/json")
+
+
+@app.get("/terms", response_model=List[TermCount])
+async def get_terms(start_date: str, end_date: str, sentiment: Optional[int] = None,
+                    limit: int = Query(200, ge=1, le=MAX_TERMS)):
+    start_datetime, end_datetime = parse_date_range(start_date, end_date)
+
+    async def load_terms():
+        query, params = queries.terms_query(
+            start_datetime, end_datetime, sentiment, limit)
+        async with db.acquire() as conn:
+            rows = await conn.fetch(query, *params)
+        return serialization.encode_rows(rows)
+
+    body = await TERMS_CACHE.get_or_load(
+        (start_datetime, end_datetime, sentiment, limit), load_terms)
+    return Response(content=body, media_type="application/json")
 
 
 @app.post("/feedback")
 async def post_feedback(feedback: Feedback):
-    endpoint = "/feedback"
-    REQUEST_COUNT.labels(endpoint=endpoint).inc()
-    start_time = t.time()
-    try:
-        logger.info(f"Received feedback: {feedback}")
-        conn = await connect_db()
+    logger.info(f"Received feedback: {feedback}")
+    title = TITLE_CACHE.get(feedback.article_id)
+    if title is None:
         # Fetch title from database
         title_query = "SELECT title FROM articles WHERE id = $1"
-        row = await conn.fetchrow(title_query, feedback.article_id)
-        await conn.close()
-        if not row:
+        async with db.acquire() as conn:
+            title = await conn.fetchval(title_query, feedback.article_id)
+        if title is None:
             raise HTTPException(status_code=404, detail="Article not found")
-        article_title = row['title'].replace(",", " ")
-        feedback_line = f"{feedback.article_id},{feedback.corrected_sentiment},\"{article_title}\",{datetime.now(timezone.utc).isoformat()}\n"
-
-        feedback_dir = "/data"
-        os.makedirs(feedback_dir, exist_ok=True)
-        feedback_file = os.path.join(feedback_dir, "feedback.csv")
-        with open(feedback_file, "a") as f:
-            f.write(feedback_line)
-
-        logger.info(f"Feedback recorded for article ID {feedback.article_id}")
-        return {"message": "Feedback recorded"}
-    except Exception as e:
-        REQUEST_ERRORS.labels(endpoint=endpoint).inc()
-        raise e
-    finally:
-        REQUEST_LATENCY.labels(endpoint=endpoint).observe(
-            t.time() - start_time)
+        TITLE_CACHE.put(feedback.article_id, title)
+    article_title = title.replace(",", " ")
+    feedback_line = f"{feedback.article_id},{feedback.corrected_sentiment},\"{article_title}\",{datetime.now(timezone.utc).isoformat()}\n"
+
+    # written to FEEDBACK_FILE by the background writer
+    FEEDBACK_WRITER.put(feedback_line)
+
+    logger.info(f"Feedback queued for article ID {feedback.article_id}")
+    return {"message": "Feedback recorded"}
+
+
+def image_headers(image_hash):
+    # images are content-addressed, so the hash is a strong ETag
+    return {"ETag": f'"{image_hash}"', "Cache-Control": IMAGE_CACHE_CONTROL}
+
+
+@app.get("/images/{article_id}")
+async def get_image(article_id: int, if_none_match: Optional[str] = Header(None)):
+    async with db.acquire() as conn:
+        if if_none_match is not None:
+            image_hash = await conn.fetchval(queries.IMAGE_HASH_QUERY, article_id)
+            if image_hash is not None and f'"{image_hash}"' in [
+                    tag.strip() for tag in if_none_match.split(",")]:
+                return Response(status_code=304, headers=image_headers(image_hash))
+        image = await conn.fetchrow(queries.IMAGE_QUERY, article_id)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return Response(content=image["content"], media_type=image["content_type"],
+                    headers=image_headers(image["hash"]))
@@ -0,0 +1,106 @@
+"""Rows/sec of the /articles serialization paths.
+
+Compares the per-row pytz + pydantic path that /articles used to take
+against encoding wire-format rows with serialization.encode_rows.
+
+    python bench_serialization.py [--rows 10000] [--repeat 5]
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+import pytz
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, TypeAdapter
+
+import serialization
+
+
+IST = pytz.timezone("Asia/Kolkata")
+
+
+class Article(BaseModel):
+    id: int
+    title: str
+    publication_timestamp: datetime
+    article_link: str
+    summary: Optional[str]
+    image_url: Optional[str]
+    sentiment: Optional[int]
+
+
+ARTICLE_LIST = TypeAdapter(List[Article])
+
+
+def make_rows(n):
+    """Rows as asyncpg returns them to the legacy and the fast path"""
+    base = datetime(2025, 5, 1, tzinfo=timezone.utc)
+    legacy, wire = [], []
+    for i in range(n):
+        ts = base - timedelta(minutes=i)
+        row = {
+            "id": i,
+            "title": f"Headline number {i} about markets, politics and sport",
+            "article_link": f"https://example.com/news/article-{i}.ece",
+            "summary": "A short summary of the article that the feed ships. " * 3,
+            "image_url": f"/images/{i}" if i % 2 else None,
+            "sentiment": i % 3,
+        }
+        legacy.append({**row, "publication_timestamp": ts})
+        wire.append({**row, "publication_timestamp": ts.astimezone(
+            IST).strftime("%Y-%m-%dT%H:%M:%S+05:30")})
+    return legacy, wire
+
+
+def legacy_path(rows):
+    articles = []
+    for record in rows:
+        ist_time = record["publication_timestamp"].replace(
+            tzinfo=pytz.utc).astimezone(IST)
+        articles.append(Article(
+            id=record["id"],
+            title=record["title"],
+            publication_timestamp=ist_time,
+            article_link=record["article_link"],
+            summary=record["summary"],
+            image_url=record["image_url"],
+            sentiment=record["sentiment"]
+        ))
+    # what FastAPI does with a response_model before JSONResponse renders it
+    validated = ARTICLE_LIST.validate_python(articles, from_attributes=True)
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+
+def fast_path(rows):
+    return serialization.encode_rows(rows)
+
+
+def bench(fn, rows, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn(rows)
+        best = min(best, time.perf_counter() - start)
+    return len(rows) / best, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    legacy_rows, wire_rows = make_rows(args.rows)
+    before, before_bytes = bench(legacy_path, legacy_rows, args.repeat)
+    after, after_bytes = bench(fast_path, wire_rows, args.repeat)
+
+    print(f"{'path':<10}{'rows/sec':>14}{'bytes':>12}")
+    print(f"{'before':<10}{before:>14,.0f}{before_bytes:>12,}")
+    print(f"{'after':<10}{after:>14,.0f}{after_bytes:>12,}")
+    print(f"speed-up: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from prometheus_client import Counter, Gauge
+import db
+
+
+logger = logging.getLogger("cache")
+
+# channel the rss_reader notifies after committing new articles
+CHANGES_CHANNEL = "articles_changed"
+# seconds between liveness checks on the LISTEN connection
+LISTEN_HEALTHCHECK_INTERVAL = float(os.getenv("CACHE_LISTEN_HEALTHCHECK_INTERVAL", "30"))
+# seconds to wait before reconnecting a dropped LISTEN connection
+LISTEN_RETRY_INTERVAL = float(os.getenv("CACHE_LISTEN_RETRY_INTERVAL", "5"))
+
+
+# Prometheus metrics
+CACHE_REQUESTS = Counter("api_cache_requests_total",
+                         "Cache lookups by result (hit, miss, coalesced)", ["cache", "result"])
+CACHE_ENTRIES = Gauge("api_cache_entries",
+                      "Number of entries held in the cache", ["cache"])
+CACHE_INVALIDATIONS = Counter("api_cache_invalidations_total",
+                              "Number of times the cache was flushed", ["cache"])
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used key"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self._data:
+            return default
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
+class QueryCache:
+    """LRU query-result cache that coalesces concurrent misses.
+
+    The cache is only consulted while `enabled` is set, which the change
+    listener does for as long as it holds a live LISTEN connection.
+    """
+
+    def __init__(self, name, max_entries):
+        self.name = name
+        self.enabled = False
+        self._entries = LRUCache(max_entries)
+        self._inflight = {}
+        self._generation = 0
+
+    async def get_or_load(self, key, loader):
+        if not self.enabled:
+            return await loader()
+        if key in self._entries:
+            CACHE_REQUESTS.labels(cache=self.name, result="hit").inc()
+            return self._entries.get(key)
+        task = self._inflight.get(key)
+        if task is None:
+            CACHE_REQUESTS.labels(cache=self.name, result="miss").inc()
+            task = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[key] = task
+        else:
+            CACHE_REQUESTS.labels(cache=self.name, result="coalesced").inc()
+        # shield so one caller disconnecting does not cancel the shared load
+        return await asyncio.shield(task)
+
+    async def _load(self, key, loader):
+        generation = self._generation
+        try:
+            value = await loader()
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+        # results that raced with an invalidation may already be stale
+        if self.enabled and generation == self._generation:
+            self._entries.put(key, value)
+            CACHE_ENTRIES.labels(cache=self.name).set(len(self._entries))
+        return value
+
+    def invalidate(self):
+        self._generation += 1
+        self._entries.clear()
+        self._inflight.clear()
+        CACHE_ENTRIES.labels(cache=self.name).set(0)
+        CACHE_INVALIDATIONS.labels(cache=self.name).inc()
+
+
+async def listen_for_changes(caches):
+    """Keep a dedicated LISTEN connection open and flush caches on NOTIFY.
+
+    Notifications sent while the connection is down are lost, so caches
+    are disabled until the listener is back and flushed when it returns.
+    """
+    def on_notify(connection, pid, channel, payload):
+        logger.info(f"Change notification on {channel}, invalidating caches.")
+        for cache in caches:
+            cache.invalidate()
+
+    while True:
+        conn = None
+        try:
+            conn = await db.connect()
+            await conn.add_listener(CHANGES_CHANNEL, on_notify)
+            for cache in caches:
+                cache.invalidate()
+                cache.enabled = True
+            logger.info(f"Listening on {CHANGES_CHANNEL}, caches enabled.")
+            while not conn.is_closed():
+                await asyncio.sleep(LISTEN_HEALTHCHECK_INTERVAL)
+                await conn.execute("SELECT 1")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Change listener failed: {e}")
+        finally:
+            for cache in caches:
+                cache.enabled = False
+                cache.invalidate()
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        await asyncio.sleep(LISTEN_RETRY_INTERVAL)
@@ -0,0 +1,133 @@
+import asyncio
+import asyncpg
+import os
+import logging
+import time
+from contextlib import asynccontextmanager
+from prometheus_client import Counter, Gauge, Histogram
+import metrics_middleware
+
+
+logger = logging.getLogger("db")
+
+# Database config
+DB_HOST = os.getenv("POSTGRES_HOST")
+DB_PORT = os.getenv("POSTGRES_PORT")
+DB_NAME = os.getenv("POSTGRES_DB")
+DB_USER = os.getenv("POSTGRES_USER")
+DB_PASSWORD = os.getenv("POSTGRES_PASSWORD")
+
+# Pool config
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# number of prepared statements cached per connection (0 disables)
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+# seconds a request may wait for a free connection before giving up
+ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "5"))
+# seconds a single query may run before being cancelled
+COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))
+# idle connections above min size are closed after this many seconds
+MAX_INACTIVE_LIFETIME = float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", "300"))
+
+
+# Prometheus metrics
+POOL_SIZE = Gauge("db_pool_size", "Number of open connections in the pool")
+POOL_IN_USE = Gauge("db_pool_connections_in_use",
+                    "Number of pool connections currently checked out")
+POOL_SATURATION = Gauge("db_pool_saturation_ratio",
+                        "Checked out connections as a fraction of the max pool size")
+POOL_ACQUIRE_LATENCY = Histogram("db_pool_acquire_latency_seconds",
+                                 "Time spent waiting for a pool connection in seconds")
+POOL_ACQUIRE_TIMEOUTS = Counter("db_pool_acquire_timeouts_total",
+                                "Number of pool acquires that timed out")
+QUERY_LATENCY = Histogram("db_query_latency_seconds",
+                          "Time spent in database queries in seconds, by route and statement",
+                          ["route", "statement", "status"])
+
+
+class PoolTimeout(Exception):
+    """Raised when no pool connection frees up within ACQUIRE_TIMEOUT"""
+
+
+pool = None
+_in_use = 0
+
+
+async def connect():
+    """Function to open a dedicated connection outside the pool"""
+    return await asyncpg.connect(
+        host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASSWORD, port=DB_PORT
+    )
+
+
+def observe_query(record):
+    """asyncpg query logger, called on the requesting task's context"""
+    route = metrics_middleware.current_route.get()
+    if record.query.startswith("SELECT pg_advisory_unlock_all()"):
+        # the reset asyncpg runs on every connection returned to the pool
+        statement = "RESET"
+    else:
+        statement = record.query.split(None, 1)[0].rstrip(";").upper()
+    status = "error" if record.exception is not None else "ok"
+    QUERY_LATENCY.labels(route=route, statement=statement,
+                         status=status).observe(record.elapsed)
+
+
+async def init_connection(conn):
+    conn.add_query_logger(observe_query)
+
+
+async def create_pool():
+    """Function to open the shared connection pool"""
+    global pool
+    pool = await asyncpg.create_pool(
+        host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASSWORD, port=DB_PORT,
+        min_size=POOL_MIN_SIZE,
+        max_size=POOL_MAX_SIZE,
+        statement_cache_size=STATEMENT_CACHE_SIZE,
+        max_inactive_connection_lifetime=MAX_INACTIVE_LIFETIME,
+        command_timeout=COMMAND_TIMEOUT,
+        init=init_connection,
+    )
+    POOL_SIZE.set(pool.get_size())
+    logger.info(
+        f"Connection pool ready (min={POOL_MIN_SIZE}, max={POOL_MAX_SIZE})")
+    return pool
+
+
+async def close_pool():
+    """Function to close the shared connection pool"""
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+        POOL_SIZE.set(0)
+        logger.info("Connection pool closed.")
+
+
+def _update_usage(delta):
+    global _in_use
+    _in_use += delta
+    POOL_IN_USE.set(_in_use)
+    POOL_SATURATION.set(_in_use / POOL_MAX_SIZE)
+    POOL_SIZE.set(pool.get_size())
+
+
+@asynccontextmanager
+async def acquire():
+    """Check out a pooled connection, recording wait time and pool usage"""
+    start_time = time.perf_counter()
+    try:
+        conn = await pool.acquire(timeout=ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        POOL_ACQUIRE_TIMEOUTS.inc()
+        raise PoolTimeout(
+            f"No database connection available within {ACQUIRE_TIMEOUT}s")
+    finally:
+        POOL_ACQUIRE_LATENCY.observe(time.perf_counter() - start_time)
+    _update_usage(1)
+    try:
+        yield conn
+    finally:
+        _update_usage(-1)
+        await pool.release(conn)
@@ -0,0 +1,114 @@
+import asyncio
+import fcntl
+import logging
+import os
+import time
+from prometheus_client import Counter, Gauge, Histogram
+
+
+logger = logging.getLogger("feedback_queue")
+
+# seconds to wait before retrying a failed flush
+RETRY_INTERVAL = 1.0
+# flush attempts made for the final batches during shutdown
+SHUTDOWN_ATTEMPTS = 3
+
+
+# Prometheus metrics
+QUEUE_DEPTH = Gauge("feedback_queue_depth",
+                    "Feedback records waiting to be written")
+FLUSHES = Counter("feedback_flushes_total", "Number of feedback batch writes")
+FLUSHED_RECORDS = Counter("feedback_flushed_records_total",
+                          "Number of feedback records written to disk")
+FLUSH_ERRORS = Counter("feedback_flush_errors_total",
+                       "Number of failed feedback batch writes")
+FLUSH_LATENCY = Histogram("feedback_flush_latency_seconds",
+                          "Time spent writing a feedback batch in seconds")
+
+
+class FeedbackWriter:
+    """Single writer that appends queued feedback lines to a CSV in batches.
+
+    A batch is flushed once `batch_size` lines are queued or `flush_interval`
+    seconds have passed, whichever comes first. Writes run off the event loop
+    and hold an exclusive flock so several backend workers can share the file.
+    """
+
+    def __init__(self, path, batch_size, flush_interval, fsync=True):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._queue = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = None
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._task = asyncio.create_task(self._run())
+
+    def put(self, line):
+        if self._stopping:
+            raise RuntimeError("Feedback writer is shutting down")
+        self._queue.put_nowait(line)
+        QUEUE_DEPTH.set(self._queue.qsize())
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+
+    async def stop(self):
+        """Stop accepting lines and wait until everything queued is on disk"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+        logger.info("Feedback queue drained.")
+
+    async def _run(self):
+        while True:
+            if not self._stopping and self._queue.qsize() < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            while not self._queue.empty():
+                batch = []
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                QUEUE_DEPTH.set(self._queue.qsize())
+                await self._flush(batch)
+            if self._stopping:
+                return
+
+    async def _flush(self, batch):
+        attempt = 0
+        while True:
+            attempt += 1
+            start_time = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._write, batch)
+                FLUSHES.inc()
+                FLUSHED_RECORDS.inc(len(batch))
+                return
+            except OSError as e:
+                FLUSH_ERRORS.inc()
+                logger.error(f"Failed to write {len(batch)} feedback records: {e}")
+                if self._stopping and attempt >= SHUTDOWN_ATTEMPTS:
+                    # last resort so the records are at least in the logs
+                    logger.error("Dropping unwritten feedback:\n" + "".join(batch))
+                    return
+                await asyncio.sleep(RETRY_INTERVAL)
+            finally:
+                FLUSH_LATENCY.observe(time.perf_counter() - start_time)
+
+    def _write(self, batch):
+        with open(self.path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write("".join(batch))
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
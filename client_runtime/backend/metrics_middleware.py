@@ -0,0 +1,79 @@
+import time
+from contextvars import ContextVar
+from prometheus_client import Gauge, Histogram
+from starlette.routing import Match
+
+
+# route template of the request being served, e.g. "/images/{article_id}"
+current_route = ContextVar("current_route", default="<background>")
+
+UNMATCHED_ROUTE = "<unmatched>"
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+# Prometheus metrics
+HTTP_LATENCY = Histogram("http_request_duration_seconds",
+                         "Request latency in seconds, until the last body byte is sent",
+                         ["method", "route", "status"])
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight",
+                       "Requests currently being served", ["method", "route"])
+HTTP_RESPONSE_SIZE = Histogram("http_response_size_bytes",
+                               "Response body size in bytes", ["method", "route"],
+                               buckets=SIZE_BUCKETS)
+
+
+def resolve_route(scope):
+    """Route template for the request, keeping label cardinality bounded"""
+    app = scope.get("app")
+    router = getattr(app, "router", None)
+    for route in getattr(router, "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return UNMATCHED_ROUTE
+
+
+class PrometheusMiddleware:
+    """ASGI middleware recording per-route latency, in-flight requests and
+    response sizes.
+
+    `on_response(route, status, elapsed)` is called after every request so
+    an app can keep feeding its own metrics from one place.
+    """
+
+    def __init__(self, app, on_response=None):
+        self.app = app
+        self.on_response = on_response
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = resolve_route(scope)
+        token = current_route.set(route)
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        HTTP_IN_FLIGHT.labels(method=method, route=route).inc()
+        start_time = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start_time
+            HTTP_IN_FLIGHT.labels(method=method, route=route).dec()
+            HTTP_LATENCY.labels(method=method, route=route,
+                                status=str(status)).observe(elapsed)
+            HTTP_RESPONSE_SIZE.labels(method=method, route=route).observe(size)
+            if self.on_response is not None:
+                self.on_response(route, status, elapsed)
+            current_route.reset(token)
@@ -0,0 +1,168 @@
+"""Apply numbered SQL migrations to an existing database.
+
+Migrations live in migrations/ as NNNN_description.sql and are applied in
+order, each in its own transaction, and recorded in schema_migrations.
+Data migrations can be NNNN_description.py modules defining
+`async def migrate(conn)`; they manage their own transactions (e.g. to work
+in batches) and must be safe to re-run if interrupted.
+
+    python migrate.py            apply pending migrations
+    python migrate.py --check    verify the hot queries use their indexes
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import re
+from datetime import datetime
+import pytz
+import logger_config
+import db
+import queries
+
+
+logger_config.set_logger()
+logger = logging.getLogger("migrate")
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE = re.compile(r"^(\d+)_(\w+)\.(sql|py)$")
+# serializes concurrent runners (e.g. two containers starting at once)
+ADVISORY_LOCK_ID = 72010001
+
+IST = pytz.timezone("Asia/Kolkata")
+
+
+def discover():
+    """Return (version, name, path) for every migration file, in order"""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2),
+                               os.path.join(MIGRATIONS_DIR, filename)))
+    migrations.sort()
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions in {MIGRATIONS_DIR}")
+    return migrations
+
+
+def load_module(version, name, path):
+    spec = importlib.util.spec_from_file_location(f"migration_{version:04d}_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+async def record(conn, version, name):
+    await conn.execute(
+        "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)",
+        version, name)
+
+
+async def migrate(conn):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+        );
+    """)
+    await conn.execute("SELECT pg_advisory_lock($1)", ADVISORY_LOCK_ID)
+    try:
+        applied = {row["version"] for row in await conn.fetch(
+            "SELECT version FROM schema_migrations")}
+        pending = [m for m in discover() if m[0] not in applied]
+        if not pending:
+            logger.info("Database schema is up to date.")
+        for version, name, path in pending:
+            logger.info(f"Applying migration {version:04d}_{name}...")
+            if path.endswith(".py"):
+                await load_module(version, name, path).migrate(conn)
+                await record(conn, version, name)
+            else:
+                with open(path, encoding="utf-8") as f:
+                    sql = f.read()
+                async with conn.transaction():
+                    await conn.execute(sql)
+                    await record(conn, version, name)
+            logger.info(f"Applied migration {version:04d}_{name}.")
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", ADVISORY_LOCK_ID)
+
+
+def index_names(plan):
+    """Collect every index a JSON EXPLAIN plan touches"""
+    names = set()
+    if "Index Name" in plan:
+        names.add(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        names |= index_names(child)
+    return names
+
+
+def index_checks():
+    """(description, query, params, expected index) for the backend's hot queries"""
+    end = IST.localize(datetime.now())
+    start = end.replace(hour=0, minute=0, second=0, microsecond=0)
+    all_query, all_params = queries.articles_query(start, end)
+    by_sentiment_query, by_sentiment_params = queries.articles_query(
+        start, end, sentiment=1)
+    stats_query, stats_params = queries.stats_query(
+        start.replace(tzinfo=None), end.replace(tzinfo=None), "day")
+    terms_query, terms_params = queries.terms_query(start, end)
+    return [
+        ("/articles", all_query, all_params, "idx_articles_pub_ts"),
+        ("/articles?sentiment=", by_sentiment_query, by_sentiment_params,
+         "idx_articles_sentiment_pub_ts"),
+        ("/images/{article_id}", queries.IMAGE_QUERY, [1], "image_blobs_pkey"),
+        ("/stats", stats_query, stats_params, "sentiment_hourly_pkey"),
+        ("/terms", terms_query, terms_params, "article_terms_pkey"),
+    ]
+
+
+async def check(conn):
+    """EXPLAIN each hot query and fail if its index is not used.
+
+    Sequential scans are disabled for the check so small tables do not hide
+    a missing or unusable index behind a cheaper seq scan.
+    """
+    failures = 0
+    async with conn.transaction():
+        await conn.execute("SET LOCAL enable_seqscan = off")
+        for description, query, params, expected in index_checks():
+            plan = json.loads(await conn.fetchval(
+                f"EXPLAIN (FORMAT JSON) {query}", *params))[0]["Plan"]
+            used = index_names(plan)
+            if expected in used:
+                logger.info(f"OK   {description}: uses {expected}")
+            else:
+                failures += 1
+                logger.error(
+                    f"FAIL {description}: expected {expected}, plan uses {sorted(used) or 'no index'}")
+    return failures
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true",
+                        help="verify the backend queries use their indexes")
+    args = parser.parse_args()
+
+    conn = await db.connect()
+    try:
+        if args.check:
+            failures = await check(conn)
+            if failures:
+                raise SystemExit(f"{failures} query plan check(s) failed")
+        else:
+            await migrate(conn)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,11 @@
+-- Indexes behind the /articles and /images queries.
+-- (publication_timestamp, id) matches the keyset order used for paging.
+CREATE INDEX IF NOT EXISTS idx_articles_pub_ts
+    ON articles (publication_timestamp DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_articles_sentiment_pub_ts
+    ON articles (sentiment, publication_timestamp DESC, id DESC);
+
+-- also serves the ON DELETE CASCADE lookup from articles
+CREATE INDEX IF NOT EXISTS idx_images_article_id
+    ON images (article_id, id);
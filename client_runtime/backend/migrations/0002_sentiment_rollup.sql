@@ -0,0 +1,17 @@
+-- Hourly article counts per sentiment, maintained by the rss_reader at
+-- insert time and read by /stats. Buckets are IST wall-clock hours so
+-- that days roll up on IST midnight (IST is UTC+05:30).
+CREATE TABLE IF NOT EXISTS sentiment_hourly (
+    bucket TIMESTAMP NOT NULL,
+    sentiment SMALLINT NOT NULL,
+    article_count INTEGER NOT NULL,
+    PRIMARY KEY (bucket, sentiment)
+);
+
+INSERT INTO sentiment_hourly (bucket, sentiment, article_count)
+SELECT date_trunc('hour', publication_timestamp AT TIME ZONE 'Asia/Kolkata'),
+    sentiment, count(*)
+FROM articles
+WHERE sentiment IS NOT NULL
+GROUP BY 1, 2
+ON CONFLICT (bucket, sentiment) DO NOTHING;
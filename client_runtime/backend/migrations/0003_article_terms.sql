@@ -0,0 +1,41 @@
+-- Per-article term counts behind /terms, computed once when an article is
+-- ingested (see db_utils.push) so the WordCloud only needs a SUM.
+CREATE OR REPLACE FUNCTION extract_terms(doc TEXT)
+RETURNS TABLE (term TEXT, term_count INTEGER)
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT t.term, count(*)::integer
+    FROM (
+        SELECT regexp_replace(m[1], '''s$', '') AS term
+        FROM regexp_matches(
+            lower(regexp_replace(coalesce(doc, ''), '<[^>]*>', ' ', 'g')),
+            '([a-z][a-z''-]*[a-z])', 'g') AS m
+    ) t
+    WHERE length(t.term) >= 3
+        AND t.term <> ALL (ARRAY[
+            'about', 'above', 'after', 'again', 'against', 'all', 'also', 'and',
+            'any', 'are', 'because', 'been', 'before', 'being', 'below', 'between',
+            'both', 'but', 'can', 'could', 'did', 'does', 'doing', 'down', 'during',
+            'each', 'few', 'for', 'from', 'further', 'had', 'has', 'have', 'having',
+            'her', 'here', 'hers', 'herself', 'him', 'himself', 'his', 'how', 'into',
+            'its', 'itself', 'just', 'more', 'most', 'not', 'now', 'off', 'once',
+            'only', 'other', 'our', 'ours', 'ourselves', 'out', 'over', 'own', 'said',
+            'same', 'says', 'she', 'should', 'some', 'such', 'than', 'that', 'the',
+            'their', 'theirs', 'them', 'themselves', 'then', 'there', 'these', 'they',
+            'this', 'those', 'through', 'too', 'under', 'until', 'very', 'was', 'were',
+            'what', 'when', 'where', 'which', 'while', 'who', 'whom', 'why', 'will',
+            'with', 'would', 'you', 'your', 'yours', 'yourself', 'yourselves'
+        ])
+    GROUP BY t.term
+$$;
+
+CREATE TABLE IF NOT EXISTS article_terms (
+    article_id INTEGER NOT NULL REFERENCES articles(id) ON DELETE CASCADE,
+    term TEXT NOT NULL,
+    term_count INTEGER NOT NULL,
+    PRIMARY KEY (article_id, term)
+);
+
+INSERT INTO article_terms (article_id, term, term_count)
+SELECT a.id, t.term, t.term_count
+FROM articles a, extract_terms(a.title || ' ' || coalesce(a.summary, '')) t
+ON CONFLICT (article_id, term) DO NOTHING;
@@ -0,0 +1,19 @@
+-- Content-addressed image store: one row per distinct image, keyed by the
+-- hex sha256 of its bytes and referenced from articles.image_hash, so an
+-- image shared by several articles is stored once.
+CREATE TABLE IF NOT EXISTS image_blobs (
+    hash TEXT PRIMARY KEY,
+    content BYTEA NOT NULL,
+    content_type TEXT NOT NULL,
+    byte_size INTEGER NOT NULL
+);
+
+-- images are already compressed, skip pglz and store them out of line
+ALTER TABLE image_blobs ALTER COLUMN content SET STORAGE EXTERNAL;
+
+ALTER TABLE articles
+    ADD COLUMN IF NOT EXISTS image_hash TEXT REFERENCES image_blobs (hash);
+
+-- finds the articles still using a blob before it is deleted
+CREATE INDEX IF NOT EXISTS idx_articles_image_hash
+    ON articles (image_hash) WHERE image_hash IS NOT NULL;
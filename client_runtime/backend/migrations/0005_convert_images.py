@@ -0,0 +1,79 @@
+"""Move images.image_base64 rows into image_blobs as raw bytes.
+
+Works in batches of articles, each in its own transaction, so a large table
+is converted without one long transaction and an interrupted run picks up
+the articles that still have no image_hash. Only the first image of an
+article is kept, which is the one /images served.
+"""
+import base64
+import binascii
+import hashlib
+import logging
+
+
+logger = logging.getLogger("migrate")
+
+BATCH_SIZE = 500
+
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+
+def sniff_content_type(content):
+    for signature, media_type in IMAGE_SIGNATURES:
+        if content.startswith(signature):
+            return media_type
+    if content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+async def migrate(conn):
+    last_article_id = 0
+    converted = invalid = 0
+    while True:
+        async with conn.transaction():
+            rows = await conn.fetch("""
+                SELECT DISTINCT ON (i.article_id) i.article_id, i.image_base64
+                FROM images i
+                JOIN articles a ON a.id = i.article_id
+                WHERE i.article_id > $1 AND a.image_hash IS NULL
+                ORDER BY i.article_id, i.id
+                LIMIT $2
+            """, last_article_id, BATCH_SIZE)
+            if not rows:
+                break
+            last_article_id = rows[-1]["article_id"]
+
+            blobs, article_ids, hashes = {}, [], []
+            for row in rows:
+                try:
+                    content = base64.b64decode(row["image_base64"], validate=True)
+                except (binascii.Error, ValueError):
+                    invalid += 1
+                    logger.warning(f"Skipping undecodable image of article {row['article_id']}.")
+                    continue
+                image_hash = hashlib.sha256(content).hexdigest()
+                blobs[image_hash] = content
+                article_ids.append(row["article_id"])
+                hashes.append(image_hash)
+
+            await conn.execute("""
+                INSERT INTO image_blobs (hash, content, content_type, byte_size)
+                SELECT * FROM unnest($1::text[], $2::bytea[], $3::text[], $4::int[])
+                ON CONFLICT (hash) DO NOTHING
+            """, list(blobs), list(blobs.values()),
+                [sniff_content_type(content) for content in blobs.values()],
+                [len(content) for content in blobs.values()])
+            await conn.execute("""
+                UPDATE articles a SET image_hash = v.image_hash
+                FROM unnest($1::int[], $2::text[]) AS v (id, image_hash)
+                WHERE a.id = v.id
+            """, article_ids, hashes)
+            converted += len(article_ids)
+        logger.info(f"Converted images of {converted} articles...")
+    logger.info(f"Converted images of {converted} articles, skipped {invalid} undecodable.")
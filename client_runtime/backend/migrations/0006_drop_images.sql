@@ -0,0 +1,3 @@
+-- Every image now lives in image_blobs (0005), the base64 table and its
+-- index are no longer read or written.
+DROP TABLE IF EXISTS images;
@@ -0,0 +1,4 @@
+-- Articles stored while the model proxy was failing have no sentiment yet;
+-- the rss_reader's rescorer pages through them by id.
+CREATE INDEX IF NOT EXISTS idx_articles_unscored
+    ON articles (id) WHERE sentiment IS NULL;
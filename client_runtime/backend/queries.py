@@ -0,0 +1,115 @@
+import base64
+import json
+from datetime import datetime
+
+
+# Columns come back in the exact shape of the Article model so rows can be
+# encoded to JSON without a per-row conversion. IST has no DST, so the
+# offset is fixed; timestamps are ingested at second precision.
+ARTICLE_COLUMNS = """
+    SELECT a.id, a.title,
+        to_char(a.publication_timestamp AT TIME ZONE 'Asia/Kolkata',
+                'YYYY-MM-DD"T"HH24:MI:SS"+05:30"') AS publication_timestamp,
+        a.article_link, a.summary,
+        CASE WHEN a.image_hash IS NOT NULL
+            THEN '/images/' || a.id END AS image_url,
+        a.sentiment
+    FROM articles a
+"""
+
+# the hash alone answers conditional requests without reading the image
+IMAGE_HASH_QUERY = """
+    SELECT image_hash FROM articles WHERE id = $1
+"""
+
+IMAGE_QUERY = """
+    SELECT b.hash, b.content, b.content_type
+    FROM articles a
+    JOIN image_blobs b ON b.hash = a.image_hash
+    WHERE a.id = $1
+"""
+
+
+def articles_query(start_datetime, end_datetime, sentiment=None, after=None, limit=None):
+    """Build the /articles query and its positional parameters.
+
+    Rows are ordered newest first on (publication_timestamp, id) so that a
+    page can be resumed with a keyset condition on the last row seen.
+    """
+    query = ARTICLE_COLUMNS + " WHERE a.publication_timestamp BETWEEN $1 AND $2"
+    params = [start_datetime, end_datetime]
+
+    if sentiment is not None:
+        params.append(sentiment)
+        query += f" AND a.sentiment = ${len(params)}"
+
+    if after is not None:
+        params.extend(after)
+        query += f" AND (a.publication_timestamp, a.id) < (${len(params) - 1}, ${len(params)})"
+
+    query += " ORDER BY a.publication_timestamp DESC, a.id DESC"
+
+    if limit is not None:
+        params.append(limit)
+        query += f" LIMIT ${len(params)}"
+
+    return query, params
+
+
+def stats_query(start_bucket, end_bucket, granularity, sentiment=None):
+    """Build the /stats query over the hourly rollup.
+
+    Buckets are naive IST wall-clock timestamps, `granularity` is a
+    date_trunc field ("hour" or "day").
+    """
+    query = """
+        SELECT to_char(date_trunc($3, bucket), 'YYYY-MM-DD"T"HH24:MI:SS"+05:30"') AS bucket,
+            sentiment, SUM(article_count)::integer AS count
+        FROM sentiment_hourly
+        WHERE bucket BETWEEN $1 AND $2
+    """
+    params = [start_bucket, end_bucket, granularity]
+
+    if sentiment is not None:
+        params.append(sentiment)
+        query += f" AND sentiment = ${len(params)}"
+
+    query += " GROUP BY 1, 2 ORDER BY 1, 2"
+    return query, params
+
+
+def terms_query(start_datetime, end_datetime, sentiment=None, limit=200):
+    """Build the /terms query: top term frequencies over a date range"""
+    query = """
+        SELECT t.term, SUM(t.term_count)::integer AS count
+        FROM articles a
+        JOIN article_terms t ON t.article_id = a.id
+        WHERE a.publication_timestamp BETWEEN $1 AND $2
+    """
+    params = [start_datetime, end_datetime]
+
+    if sentiment is not None:
+        params.append(sentiment)
+        query += f" AND a.sentiment = ${len(params)}"
+
+    params.append(limit)
+    query += f" GROUP BY t.term ORDER BY count DESC, t.term LIMIT ${len(params)}"
+    return query, params
+
+
+def encode_cursor(record):
+    """Opaque cursor pointing just past the given row"""
+    raw = json.dumps({
+        "ts": record["publication_timestamp"],
+        "id": record["id"],
+    })
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor, raises ValueError on malformed input"""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(raw["ts"]), int(raw["id"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
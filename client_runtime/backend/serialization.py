@@ -0,0 +1,27 @@
+import time
+import orjson
+from prometheus_client import Histogram
+import metrics_middleware
+
+
+SERIALIZATION_LATENCY = Histogram("api_serialization_latency_seconds",
+                                  "Time spent encoding query results in seconds", ["route"])
+
+
+def encode_rows(records):
+    """Encode rows straight to a JSON array.
+
+    Rows must already be in their wire format (see queries.ARTICLE_COLUMNS),
+    so no per-row model is built and nothing is re-validated.
+    """
+    start_time = time.perf_counter()
+    body = orjson.dumps([dict(record) for record in records])
+    SERIALIZATION_LATENCY.labels(route=metrics_middleware.current_route.get()).observe(
+        time.perf_counter() - start_time)
+    return body
+
+
+
+def encode_article_line(record):
+    """Encode a single article row as one NDJSON line"""
+    return orjson.dumps(dict(record)) + b"\n"
@@ -8,6 +8,10 @@ from streamlit_autorefresh import st_autorefresh
 
 
 API_URL = "http://backend:9500"
+# number of most frequent terms drawn in the WordCloud
+WORDCLOUD_TERMS = 200
+# (connect, read) timeouts for one article image
+IMAGE_TIMEOUT = (3, 10)
 
 
 user_manual = """
@@ -74,24 +78,36 @@ if sentiment_map[sentiment_choice] is not None:
     params["sentiment"] = sentiment_map[sentiment_choice]
 
 
+@st.cache_data(max_entries=500, show_spinner=False)
+def fetch_image(image_url):
+    """Images are immutable per article, so fetch each one only once;
+    a failed fetch raises and is not cached"""
+    image_response = requests.get(f"{API_URL}{image_url}", timeout=IMAGE_TIMEOUT)
+    image_response.raise_for_status()
+    return image_response.content
+
+
 # Fetch articles
 try:
-    response = requests.get(f"{API_URL}/articles", params=params)
-    response.raise_for_status()
-    articles = response.json()
-
-    if not articles:
-        st.info("No articles found for the selected filters.")
-    else:
-        st.write(f"Showing {len(articles)} articles")
-        if view_choice == "WordCloud":
-            # --- WordCloud view ---
-            all_text = " ".join(
-                f"{(article.get('title', '') + ' ')} {article.get('summary', '')}"
-                for article in articles
-                if article.get('summary') or article.get('title')
-            )
-            if all_text:
+    if view_choice == "WordCloud":
+        # --- WordCloud view ---
+        # only precomputed counts are fetched, never the articles themselves:
+        # term counts summed by the backend and the sentiment rollup for the
+        # number of (scored) articles
+        stats_response = requests.get(f"{API_URL}/stats", params=params)
+        stats_response.raise_for_status()
+        article_count = sum(row['count'] for row in stats_response.json())
+        terms_response = requests.get(
+            f"{API_URL}/terms", params={**params, "limit": WORDCLOUD_TERMS})
+        terms_response.raise_for_status()
+        frequencies = {row['term']: row['count']
+                       for row in terms_response.json()}
+
+        if not article_count and not frequencies:
+            st.info("No articles found for the selected filters.")
+        else:
+            st.write(f"Showing {article_count} scored articles")
+            if frequencies:
                 if sentiment_choice == "Positive":
                     colormap = "Greens"
                 elif sentiment_choice == "Negative":
@@ -106,7 +122,7 @@ try:
                     height=400,
                     background_color='white',
                     colormap=colormap
-                ).generate(all_text)
+                ).generate_from_frequencies(frequencies)
 
                 st.subheader("WordCloud of Article Summaries")
                 fig, ax = plt.subplots(figsize=(10, 5))
@@ -116,18 +132,34 @@ try:
             else:
                 st.info("No summaries available to generate WordCloud.")
 
+    else:
+        # --- Articles view ---
+        response = requests.get(f"{API_URL}/articles", params=params)
+        response.raise_for_status()
+        articles = response.json()
+
+        if not articles:
+            st.info("No articles found for the selected filters.")
         else:
-            # --- Articles view ---
+            st.write(f"Showing {len(articles)} articles")
             for article in articles:
                 with st.expander(article['title']):
                     st.write(
                         f"**Published on:** {article['publication_timestamp']}")
                     st.write(article['summary'])
                     st.markdown(f"[Read full article]({article['article_link']})")
-                    if article['image_base64']:
-                        st.image(
-                            f"data:image/jpeg;base64,{article['image_base64']}", use_container_width=True)
+                    if article['image_url']:
+                        try:
+                            image = fetch_image(article['image_url'])
+                        except requests.RequestException:
+                            # a missing image never hides the article
+                            st.caption("Image unavailable.")
+                        else:
+                            st.image(image, use_container_width=True)
 
+                    if article['sentiment'] is None:
+                        # stored while the model was down, scored later
+                        st.caption("Sentiment not scored yet.")
                     new_sentiment = st.radio(
                         f"Correct sentiment for article {article['id']}",
                         options=["Negative", "Neutral", "Positive"],
@@ -136,6 +168,9 @@ try:
                     )
 
                     if st.button(f"Submit Feedback {article['id']}"):
+                        if new_sentiment is None:
+                            st.warning("Select a sentiment first.")
+                            continue
                         feedback_payload = {
                             "article_id": article['id'],
                             "corrected_sentiment": sentiment_map[new_sentiment]
@@ -0,0 +1,124 @@
+"""Rows/sec of the db_utils.push write paths.
+
+Pushes synthetic articles through the per-row and the bulk path against the
+configured database (POSTGRES_* env vars), then deletes them again together
+with their rollup counts. "insert" times writing articles and images alone,
+"push" the whole call including the rollup, terms and commit.
+
+    python bench_push.py [--sizes 1000 100000] [--image-bytes 4000]
+"""
+import argparse
+import datetime as dt
+import os
+import time
+import pytz
+from includes import db_utils
+
+
+IST = pytz.timezone("Asia/Kolkata")
+TITLE_PREFIX = "bench-push"
+
+
+def make_rows(n, run, image_bytes):
+    """Feed items shaped like fetcher.rss_parser output, half with a distinct image"""
+    base = dt.datetime(2001, 1, 1, tzinfo=IST)
+    image = b"RIFF\0\0\0\0WEBP" + os.urandom(image_bytes)
+    rows = []
+    for i in range(n):
+        rows.append({
+            "title": f"{TITLE_PREFIX} {run} headline {i} about markets, politics and sport",
+            "pub_time": (base + dt.timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S%z"),
+            "link": f"https://example.com/news/{run}/article-{i}.ece",
+            "image": image + i.to_bytes(4, "big") if i % 2 else None,
+            "tags": ["news", "bench"],
+            "summary": "A short summary of the article, with \"quotes\" and a\nnewline.",
+            "sentiment": i % 3,
+        })
+    return rows
+
+
+def cleanup():
+    """Remove benchmark articles and take them back out of the rollup"""
+    conn = db_utils.connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+            UPDATE sentiment_hourly h SET article_count = h.article_count - b.n
+            FROM (
+                SELECT date_trunc('hour', publication_timestamp AT TIME ZONE 'Asia/Kolkata') AS bucket,
+                    sentiment, count(*) AS n
+                FROM articles
+                WHERE title LIKE %s AND sentiment IS NOT NULL
+                GROUP BY 1, 2
+            ) b
+            WHERE h.bucket = b.bucket AND h.sentiment = b.sentiment;
+            """, (TITLE_PREFIX + " %",))
+            cursor.execute("DELETE FROM sentiment_hourly WHERE article_count <= 0;")
+            # article_terms go with ON DELETE CASCADE, image blobs are shared
+            cursor.execute("""
+            WITH deleted AS (
+                DELETE FROM articles WHERE title LIKE %s RETURNING image_hash
+            )
+            SELECT DISTINCT image_hash FROM deleted WHERE image_hash IS NOT NULL;
+            """, (TITLE_PREFIX + " %",))
+            hashes = [row[0] for row in cursor.fetchall()]
+            cursor.execute("""
+            DELETE FROM image_blobs b
+            WHERE b.hash = ANY(%s)
+                AND NOT EXISTS (SELECT 1 FROM articles a WHERE a.image_hash = b.hash);
+            """, (hashes,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def timed(fn, timings):
+    def wrapper(*args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            timings.append(time.perf_counter() - start)
+    return wrapper
+
+
+def bench(mode, rows):
+    """(insert rows/sec, push rows/sec) for one push of `rows`"""
+    insert_timings = []
+    name = "insert_rows" if mode == "row" else "insert_bulk"
+    insert_fn = getattr(db_utils, name)
+    setattr(db_utils, name, timed(insert_fn, insert_timings))
+    try:
+        start = time.perf_counter()
+        inserted = db_utils.push(rows, mode=mode)
+        elapsed = time.perf_counter() - start
+    finally:
+        setattr(db_utils, name, insert_fn)
+    if inserted != len(rows):
+        raise RuntimeError(f"{mode}: expected {len(rows)} new articles, got {inserted}")
+    return len(rows) / insert_timings[0], len(rows) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--image-bytes", type=int, default=4000)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8}{'stage':>8}{'row rows/sec':>16}{'bulk rows/sec':>16}{'speed-up':>10}")
+    try:
+        for n in args.sizes:
+            results = {}
+            for mode in ("row", "bulk"):
+                rows = make_rows(n, f"{mode}-{n}", args.image_bytes)
+                results[mode] = bench(mode, rows)
+                cleanup()
+            for i, stage in enumerate(("insert", "push")):
+                row, bulk = results["row"][i], results["bulk"][i]
+                print(f"{n:>8,}{stage:>8}{row:>16,.0f}{bulk:>16,.0f}{bulk / row:>9.1f}x")
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
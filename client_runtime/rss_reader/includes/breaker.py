@@ -0,0 +1,56 @@
+import logging
+import threading
+import time
+from includes.metrics import CIRCUIT_OPEN
+
+
+logger = logging.getLogger("breaker")
+
+
+class CircuitBreaker:
+    """Skips calls to a service for a while after one fails.
+
+    Closed, every caller calls the service. A failed call opens the breaker,
+    and callers skip the service until `retry_after` seconds have passed;
+    then one caller at a time is let through as a probe, and its success
+    closes the breaker again while its failure keeps it open for another
+    `retry_after` seconds.
+    """
+
+    def __init__(self, service, retry_after):
+        self.service = service
+        self.retry_after = retry_after
+        self._opened = None
+        self._probing = False
+        self._lock = threading.Lock()
+        CIRCUIT_OPEN.labels(service=service).set(0)
+
+    def is_open(self):
+        """Whether the last call failed, without claiming a probe"""
+        return self._opened is not None
+
+    def allow(self):
+        """"call" while closed, "probe" for the caller that may test an open
+        breaker, None for callers that should skip the service"""
+        with self._lock:
+            if self._opened is None:
+                return "call"
+            if self._probing or time.monotonic() - self._opened < self.retry_after:
+                return None
+            self._probing = True
+            return "probe"
+
+    def record(self, ok):
+        """Outcome of a call or probe allowed by allow()"""
+        with self._lock:
+            self._probing = False
+            if ok and self._opened is not None:
+                logger.info(f"{self.service} answers again, closing the breaker.")
+                self._opened = None
+                CIRCUIT_OPEN.labels(service=self.service).set(0)
+            elif not ok:
+                if self._opened is None:
+                    logger.warning(f"{self.service} failed, skipping it for "
+                                   f"{self.retry_after:g}s between probes.")
+                    CIRCUIT_OPEN.labels(service=self.service).set(1)
+                self._opened = time.monotonic()
@@ -1,8 +1,12 @@
 import psycopg2
 import os
+import io
+import json
+import hashlib
 import datetime as dt
 from psycopg2.extras import Json
 import logging
+from includes.image_utils import sniff_content_type
 
 
 logger = logging.getLogger("db_utils")
@@ -12,44 +16,269 @@ DB_PORT = os.getenv("POSTGRES_PORT")
 DB_NAME = os.getenv("POSTGRES_DB")
 DB_USER = os.getenv("POSTGRES_USER")
 DB_PASSWORD = os.getenv("POSTGRES_PASSWORD")
+# channel the backend listens on to invalidate its query caches
+CHANGES_CHANNEL = "articles_changed"
+# "bulk" writes a poll with COPY + one merge statement, "row" one insert per row
+DB_PUSH_MODE = os.getenv("DB_PUSH_MODE", "bulk")
 
 
-def push(data_list):
-    """Function to push rss feed to database"""
+def connect():
+    return psycopg2.connect(
+        database=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT
+    )
+
+
+def load_seen(days):
+    """(title, pub_time) keys of articles published in the last `days` days,
+    with pub_time formatted the way the fetcher formats it"""
+    select_seen = """
+    SELECT title,
+        to_char(publication_timestamp AT TIME ZONE 'Asia/Kolkata', 'YYYY-MM-DD HH24:MI:SS') || '+0530'
+    FROM articles
+    WHERE publication_timestamp >= now() - make_interval(days => %s)
+    ORDER BY publication_timestamp;
+    """
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(select_seen, (days,))
+            return [tuple(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def update_rollup(cursor, article_ids):
+    """Add newly scored articles to the hourly sentiment rollup behind /stats"""
+    if not article_ids:
+        return
+    update_counts = """
+    INSERT INTO sentiment_hourly (bucket, sentiment, article_count)
+    SELECT date_trunc('hour', publication_timestamp AT TIME ZONE 'Asia/Kolkata'),
+        sentiment, count(*)
+    FROM articles
+    WHERE id = ANY(%s) AND sentiment IS NOT NULL
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    ON CONFLICT (bucket, sentiment)
+    DO UPDATE SET article_count = sentiment_hourly.article_count + EXCLUDED.article_count;
+    """
+    cursor.execute(update_counts, (list(article_ids),))
+
+
+def update_terms(cursor, article_ids):
+    """Store per-article term counts behind /terms, tokenized by extract_terms()"""
+    if not article_ids:
+        return
+    insert_terms = """
+    INSERT INTO article_terms (article_id, term, term_count)
+    SELECT a.id, t.term, t.term_count
+    FROM articles a, extract_terms(a.title || ' ' || coalesce(a.summary, '')) t
+    WHERE a.id = ANY(%s)
+    ON CONFLICT (article_id, term) DO NOTHING;
+    """
+    cursor.execute(insert_terms, (list(article_ids),))
+
+
+def image_hash(content):
+    """Key of an image in the content-addressed image_blobs table"""
+    return hashlib.sha256(content).hexdigest() if content else None
+
+
+def insert_rows(cursor, data_list):
+    """Insert articles and images one statement at a time, returning the new ids.
+
+    Each item's "id" is set to its new article id, or None if it was a duplicate.
+    """
+    new_ids = []
+    for data in data_list:
+        content_hash = image_hash(data["image"])
+        if content_hash:
+            insert_image = """
+            INSERT INTO image_blobs (hash, content, content_type, byte_size)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (hash) DO NOTHING;
+            """
+            cursor.execute(insert_image, (content_hash, psycopg2.Binary(data["image"]),
+                                          sniff_content_type(data["image"]), len(data["image"])))
+        insert_article = """
+        INSERT INTO articles (title, publication_timestamp, article_link, summary, sentiment, tags, image_hash)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (title, publication_timestamp) DO NOTHING
+        RETURNING id;
+        """
+        cursor.execute(
+            insert_article, (data["title"], data["pub_time"], data["link"], data["summary"], data.get("sentiment"), Json(data["tags"]), content_hash))
+        article_id = cursor.fetchone()
+        data["id"] = article_id[0] if article_id else None
+        if article_id:
+            new_ids.append(article_id[0])
+    return new_ids
+
+
+def copy_field(value):
+    """Render a value as a COPY text-format field"""
+    if value is None:
+        return "\\N"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def insert_bulk(cursor, data_list):
+    """Insert articles and images in a constant number of round-trips,
+    returning the new ids.
+
+    The batch is COPYed into a staging table and merged by one statement.
+    Items without a "sentiment" are stored unscored (NULL) for the rescorer.
+    Only the images of articles that were actually inserted are stored,
+    found by joining back on (title, publication_timestamp), the same key
+    that deduplicates articles. As in insert_rows, the first occurrence of
+    a duplicate entry wins and each item's "id" is set.
+    """
+    create_staging = """
+    CREATE TEMP TABLE push_staging (
+        ord INTEGER,
+        title TEXT,
+        pub_ts TIMESTAMP WITH TIME ZONE,
+        link TEXT,
+        summary TEXT,
+        sentiment SMALLINT,
+        tags JSONB,
+        image_hash TEXT,
+        image BYTEA,
+        image_type TEXT
+    ) ON COMMIT DROP;
+    """
+    cursor.execute(create_staging)
+
+    buffer = io.StringIO()
+    for i, data in enumerate(data_list):
+        content = data["image"]
+        fields = (i, data["title"], data["pub_time"], data["link"], data["summary"],
+                  data.get("sentiment"), json.dumps(data["tags"]), image_hash(content),
+                  "\\x" + content.hex() if content else None,
+                  sniff_content_type(content) if content else None)
+        buffer.write("\t".join(map(copy_field, fields)) + "\n")
+    buffer.seek(0)
+    cursor.copy_expert("COPY push_staging FROM STDIN;", buffer)
+
+    merge = """
+    WITH first AS (
+        SELECT DISTINCT ON (title, pub_ts) *
+        FROM push_staging
+        ORDER BY title, pub_ts, ord
+    ), inserted AS (
+        INSERT INTO articles (title, publication_timestamp, article_link, summary, sentiment, tags, image_hash)
+        SELECT title, pub_ts, link, summary, sentiment, tags, image_hash
+        FROM first
+        ORDER BY ord
+        ON CONFLICT (title, publication_timestamp) DO NOTHING
+        RETURNING id, title, publication_timestamp
+    ), inserted_images AS (
+        -- the articles' foreign key is checked at the end of the statement
+        INSERT INTO image_blobs (hash, content, content_type, byte_size)
+        SELECT DISTINCT ON (f.image_hash) f.image_hash, f.image, f.image_type, length(f.image)
+        FROM inserted i
+        JOIN first f ON f.title = i.title AND f.pub_ts = i.publication_timestamp
+        WHERE f.image_hash IS NOT NULL
+        ORDER BY f.image_hash
+        ON CONFLICT (hash) DO NOTHING
+    )
+    SELECT i.id, f.ord
+    FROM inserted i
+    JOIN first f ON f.title = i.title AND f.pub_ts = i.publication_timestamp
+    ORDER BY i.id;
+    """
+    cursor.execute(merge)
+    rows = cursor.fetchall()
+    for data in data_list:
+        data["id"] = None
+    for article_id, ord in rows:
+        data_list[ord]["id"] = article_id
+    return [article_id for article_id, _ in rows]
+
+
+def load_unscored(limit):
+    """(id, title) of the oldest `limit` articles stored without a sentiment"""
+    select_unscored = """
+    SELECT id, title FROM articles
+    WHERE sentiment IS NULL
+    ORDER BY id
+    LIMIT %s;
+    """
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(select_unscored, (limit,))
+            return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+def count_unscored():
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM articles WHERE sentiment IS NULL;")
+            return cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def store_scores(scores):
+    """Set the sentiment of unscored articles from (id, sentiment) pairs and
+    add them to the rollup, returning the number of articles scored"""
+    if not scores:
+        return 0
+    update_sentiment = """
+    UPDATE articles a SET sentiment = v.sentiment
+    FROM unnest(%s::int[], %s::smallint[]) AS v (id, sentiment)
+    WHERE a.id = v.id AND a.sentiment IS NULL
+    RETURNING a.id;
+    """
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            ids, sentiments = zip(*scores)
+            cursor.execute(update_sentiment, (list(ids), list(sentiments)))
+            scored_ids = [row[0] for row in cursor.fetchall()]
+            update_rollup(cursor, scored_ids)
+            if scored_ids:
+                cursor.execute(f"NOTIFY {CHANGES_CHANNEL};")
+        conn.commit()
+        return len(scored_ids)
+    finally:
+        conn.close()
+
+
+def push(data_list, mode=DB_PUSH_MODE):
+    """Function to push rss feed to database, returning the number of new articles"""
     if not data_list:
         logger.warning("Empty list!")
-        return
+        return 0
+    conn = cursor = None
     try:
-        new_items = 0
-        conn = psycopg2.connect(
-            database=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT
-        )
+        conn = connect()
         cursor = conn.cursor()
-        for data in data_list:
-            insert_article = """
-            INSERT INTO articles (title, publication_timestamp, article_link, summary, sentiment, tags)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            ON CONFLICT (title, publication_timestamp) DO NOTHING
-            RETURNING id;
-            """
-            cursor.execute(
-                insert_article, (data["title"], data["pub_time"], data["link"], data["summary"], data["sentiment"], Json(data["tags"])))
-            article_id = cursor.fetchone()
-            if article_id:
-                new_items += 1
-            if data["img_b64"] and article_id:
-                insert_image = """
-                INSERT INTO images (article_id, image_base64)
-                VALUES (%s, %s);
-                """
-                cursor.execute(insert_image, (article_id[0], data["img_b64"]))
+        if mode == "row":
+            new_ids = insert_rows(cursor, data_list)
+        else:
+            new_ids = insert_bulk(cursor, data_list)
+        update_rollup(cursor, new_ids)
+        update_terms(cursor, new_ids)
+        if new_ids:
+            # delivered to listeners only once the transaction commits
+            cursor.execute(f"NOTIFY {CHANGES_CHANNEL};")
         conn.commit()
-        logger.info(f"Inserted {new_items} articles successfully.")
+        logger.info(f"Inserted {len(new_ids)} articles successfully.")
+        return len(new_ids)
 
     except Exception as e:
         logger.error(f"Error inserting data: {e}")
+        raise
 
     finally:
         # closing connections to prevent locks or connection leaks regardless of status
-        cursor.close()
-        conn.close()
+        if cursor is not None:
+            cursor.close()
+        if conn is not None:
+            conn.close()
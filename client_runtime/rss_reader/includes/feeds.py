@@ -0,0 +1,67 @@
+import os
+import threading
+import time
+import logging
+
+
+logger = logging.getLogger("feeds")
+
+# space separated feed list, each entry `url` or `url|interval_seconds`
+RSS_FEEDS = os.getenv("RSS_FEEDS", "")
+# single feed settings used when RSS_FEEDS is not set
+RSS_FEED_URL = os.getenv("RSS_FEED_URL")
+POLL_INTERVAL = int(os.getenv("POLL_INTERVAL", "600"))
+
+
+class FeedState:
+    """Polling state of one feed, shared between its scheduled runs"""
+
+    def __init__(self, url, interval):
+        self.url = url
+        self.interval = interval
+        self.last_poll = None
+        self.last_success = None
+        self.last_error = None
+        self.consecutive_failures = 0
+        # cache validators of the last feed document that was fully stored
+        self.etag = None
+        self.last_modified = None
+        self.lock = threading.Lock()
+
+    def record_success(self, validators):
+        with self.lock:
+            self.etag, self.last_modified = validators
+            self.last_poll = self.last_success = time.time()
+            self.last_error = None
+            self.consecutive_failures = 0
+
+    def record_failure(self, error):
+        with self.lock:
+            self.last_poll = time.time()
+            self.last_error = str(error)
+            self.consecutive_failures += 1
+            return self.consecutive_failures
+
+
+def parse_feeds(spec, default_interval):
+    """Parse the RSS_FEEDS format into (url, interval) pairs, dropping duplicates"""
+    feeds = {}
+    for entry in spec.split():
+        url, _, interval = entry.partition("|")
+        if not url:
+            continue
+        if url in feeds:
+            logger.warning(f"Feed {url} listed more than once, keeping the first entry.")
+            continue
+        feeds[url] = int(interval) if interval else default_interval
+    return list(feeds.items())
+
+
+def load_feeds():
+    """Feeds to poll, from RSS_FEEDS or the single RSS_FEED_URL"""
+    feeds = parse_feeds(RSS_FEEDS, POLL_INTERVAL)
+    if not feeds and RSS_FEED_URL:
+        feeds = [(RSS_FEED_URL, POLL_INTERVAL)]
+    if not feeds:
+        raise ValueError("No feeds configured, set RSS_FEEDS or RSS_FEED_URL")
+    return [FeedState(url, interval) for url, interval in feeds]
@@ -2,20 +2,45 @@ import feedparser as fr
 import time
 import datetime as dt
 import includes.image_utils as iu
+from includes.breaker import CircuitBreaker
+from includes.sessions import feed_session, model_probe_session, model_session
+from includes.inference_cache import (InferenceCache, INFERENCE_CACHE_MAX_ENTRIES,
+                                      INFERENCE_CACHE_PATH)
+from includes.seen_index import SeenIndex, entry_key
 import os
 import pytz
 import logging
 import json
-import requests
+import threading
 
 
 logger = logging.getLogger("fetcher")
 
 IST = pytz.timezone("Asia/Kolkata")
-RSS_FEED_URL = os.getenv("RSS_FEED_URL")
+# (connect, read) timeouts for fetching a feed document
+FEED_TIMEOUT = (float(os.getenv("FEED_CONNECT_TIMEOUT", "5")),
+                float(os.getenv("FEED_TIMEOUT", "30")))
+# (connect, read) timeouts for one inference request
+MODEL_TIMEOUT = (float(os.getenv("MODEL_CONNECT_TIMEOUT", "3")),
+                 float(os.getenv("MODEL_TIMEOUT", "30")))
+# entries already stored, skipped before image download and inference
+SEEN_ENTRIES = SeenIndex(int(os.getenv("SEEN_MAX_ENTRIES", "200000")))
+# predictions of titles already scored, persisted across polls and restarts
+INFERENCE_CACHE = InferenceCache(INFERENCE_CACHE_PATH, INFERENCE_CACHE_MAX_ENTRIES)
+# seconds between asking the model proxy which model version it serves
+MODEL_VERSION_TTL = float(os.getenv("MODEL_VERSION_TTL", "60"))
+# connect and read timeout of that check, sent once without retries as it runs
+# on the ingest path
+MODEL_CHECK_TIMEOUT = float(os.getenv("MODEL_CHECK_TIMEOUT", "2"))
+# seconds new items skip inference after a failed request before the proxy is
+# checked again; they are stored unscored and left to the rescorer
+MODEL_PROBE_INTERVAL = float(os.getenv("MODEL_PROBE_INTERVAL", "10"))
+MODEL_BREAKER = CircuitBreaker("model", MODEL_PROBE_INTERVAL)
 
 batch_size = 16
 model_api = "http://model-proxy:8000/predict"
+model_version_api = "http://model-proxy:8000/version"
+model_health_api = "http://model-proxy:8000/healthz"
 headers = {'Content-Type': 'application/json'}
 
 
@@ -42,53 +67,221 @@ def rss_parser(rss_entry):
             if media.get('medium') == 'image':
                 image_url = media.get('url')
                 break
-    image_path = None
-    image_base64 = ''
-    if image_url:
-        filename = image_url.split("/")[-1]
-        image_path = iu.download_image(image_url, filename)
-        if image_path:
-            image_base64 = iu.image_to_base64(image_path)
-            os.remove(image_path)
     tags = [tag['term'] for tag in rss_entry.get('tags', [])]
     summary = rss_entry.get('summary', '').strip()
     data = {
         "title": title,
         "pub_time": date_obj,
         "link": article_link,
-        "img_b64": image_base64,
+        "image_url": image_url,
+        "image": None,
         "tags": tags,
         "summary": summary
     }
     return data
 
 
-def fetch_rss():
-    """Function to fetch rss feed from api endpoint"""
-    logger.info("Fetching RSS feed...")
-    feed = fr.parse(RSS_FEED_URL)
+def fetch_images(data_list):
+    """Fill in image bytes for every item, returning (seconds, slowest image seconds)"""
+    start_time = time.perf_counter()
+    results = iu.fetch_images([data["image_url"] for data in data_list])
+    for data, (content, _) in zip(data_list, results):
+        data["image"] = content
+    slowest = max((seconds for _, seconds in results), default=0.0)
+    return time.perf_counter() - start_time, slowest
+
+
+def conditional_headers(feed):
+    """If-None-Match / If-Modified-Since headers from the feed's last poll"""
+    request_headers = {}
+    if feed.etag:
+        request_headers["If-None-Match"] = feed.etag
+    if feed.last_modified:
+        request_headers["If-Modified-Since"] = feed.last_modified
+    return request_headers
+
+
+def predict(titles, session=model_session):
+    """Sentiment predictions for a batch of titles from the model proxy"""
+    payload = {
+        "instances": [
+            {"text": titles}
+        ]
+    }
+    response = session.post(
+        model_api, data=json.dumps(payload), headers=headers, timeout=MODEL_TIMEOUT)
+    response.raise_for_status()
+    preds = response.json()['predictions']
+    version = response.headers.get("X-Model-Version")
+    if version:
+        # the proxy may already serve another model, so cache lookups follow
+        # it now rather than after MODEL_VERSION_TTL
+        set_model_version(version)
+    if version and len(preds) == len(titles):
+        try:
+            INFERENCE_CACHE.put_many(zip(titles, preds), version)
+        except Exception as e:
+            logger.error(f"Could not cache {len(preds)} predictions: {e}")
+    return preds
+
+
+def guarded_predict(titles):
+    """predict() for the ingest path, behind MODEL_BREAKER: None without
+    calling the model while the last request failed, so an outage does not
+    slow ingestion down. Once MODEL_PROBE_INTERVAL has passed, one batch is
+    sent without retries if the proxy's health check answers."""
+    mode = MODEL_BREAKER.allow()
+    if mode is None:
+        return None
+    session = model_session
+    if mode == "probe":
+        session = model_probe_session
+        try:
+            model_probe_session.get(model_health_api,
+                                    timeout=MODEL_CHECK_TIMEOUT).raise_for_status()
+        except Exception as e:
+            logger.warning(f"Model proxy health check failed: {e}")
+            MODEL_BREAKER.record(False)
+            return None
+    try:
+        preds = predict(titles, session)
+    except Exception:
+        MODEL_BREAKER.record(False)
+        raise
+    MODEL_BREAKER.record(True)
+    return preds
+
+
+_model_version = {"version": None, "checked": float("-inf"), "checking": False}
+_model_version_lock = threading.Lock()
+
+
+def set_model_version(version):
+    """Record the version the proxy reported, restarting the TTL"""
+    with _model_version_lock:
+        if version != _model_version["version"]:
+            logger.info(f"Model version changed from {_model_version['version']} to {version}.")
+        _model_version.update(version=version, checked=time.monotonic())
+
+
+def model_version():
+    """Model version served by the proxy, re-checked every MODEL_VERSION_TTL
+    seconds. One caller at a time makes the check, once and with a short
+    timeout; the others, and every caller while the model is failing, get
+    the last known version rather than waiting."""
+    with _model_version_lock:
+        if (_model_version["checking"] or MODEL_BREAKER.is_open()
+                or time.monotonic() - _model_version["checked"] < MODEL_VERSION_TTL):
+            return _model_version["version"]
+        _model_version["checking"] = True
+    version = None
+    try:
+        response = model_probe_session.get(model_version_api, timeout=MODEL_CHECK_TIMEOUT)
+        response.raise_for_status()
+        version = response.json()["version"]
+    except Exception as e:
+        logger.warning(f"Could not get the model version: {e}")
+    with _model_version_lock:
+        if version is not None:
+            _model_version["version"] = version
+        # stamped after the attempt, so a slow check is not repeated at once
+        _model_version["checked"] = time.monotonic()
+        _model_version["checking"] = False
+        return _model_version["version"]
+
+
+def cached_predictions(titles):
+    """Predictions cached for the served model version, by title"""
+    if not titles:
+        return {}
+    version = model_version()
+    if version is None:
+        return {}
+    try:
+        return INFERENCE_CACHE.get_many(titles, version)
+    except Exception as e:
+        logger.error(f"Inference cache lookup failed: {e}")
+        return {}
+
+
+def fetch_feed(feed, timings=None):
+    """Fetch a feed and parse the entries that are not stored yet.
+
+    Returns the new items and the response's cache validators, which the
+    caller stores on the feed once the items are safely in the database.
+    An unchanged feed (304) returns no items and keeps the old validators.
+    """
+    timings = {} if timings is None else timings
+    logger.info(f"Fetching RSS feed {feed.url}...")
+    start_time = time.perf_counter()
+    # fetched here rather than by feedparser so a stalled feed times out
+    response = feed_session.get(feed.url, headers=conditional_headers(feed),
+                                timeout=FEED_TIMEOUT)
+    response.raise_for_status()
+    if response.status_code == 304:
+        logger.info(f"Feed {feed.url} not modified.")
+        return [], (feed.etag, feed.last_modified)
+    validators = (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+    parsed = fr.parse(response.content)
+    timings["feed"] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
     data_list = []
-    for entry in feed.entries:
-        data_list.append(rss_parser(entry))
+    for entry in parsed.entries:
+        data = rss_parser(entry)
+        if data["pub_time"] is None:
+            # publication_timestamp is NOT NULL, such an entry can never be stored
+            logger.warning(f"Skipping entry without a publication date: {data['title']!r}")
+            continue
+        if entry_key(data) not in SEEN_ENTRIES:
+            data_list.append(data)
+    timings["parse"] = time.perf_counter() - start_time
+    if not data_list:
+        logger.info(f"No new entries in {len(parsed.entries)} from {feed.url}.")
+    else:
+        logger.info(f"{len(data_list)} new of {len(parsed.entries)} entries in {feed.url}.")
+    return data_list, validators
+
+
+def fetch_rss(feed):
+    """Function to fetch rss feed from api endpoint, with images and sentiment.
+
+    Each step finishes for the whole feed before the next starts; see
+    pipeline.py for the overlapping version.
+    """
+    timings = {}
+    data_list, validators = fetch_feed(feed, timings)
+    if not data_list:
+        return [], validators
+
+    timings["images"], timings["slowest_image"] = fetch_images(data_list)
+
     logging.info("Proceeding to sentiment analysis...")
-    all_texts = [item["title"] for item in data_list]
+    start_time = time.perf_counter()
+    cached = cached_predictions([item["title"] for item in data_list])
+    for item in data_list:
+        if item["title"] in cached:
+            item["sentiment"] = cached[item["title"]]
+    # only titles the cache has no prediction for go to the model
+    misses = [item for item in data_list if "sentiment" not in item]
+    all_texts = [item["title"] for item in misses]
     for i in range(0, len(all_texts), batch_size):
         batch_texts = all_texts[i:i+batch_size]
-        payload = {
-            "instances": [
-                {"text": batch_texts}
-            ]
-        }
         try:
-            response = requests.post(
-                model_api, data=json.dumps(payload), headers=headers)
-            response.raise_for_status()
-            preds = response.json()['predictions']
+            preds = guarded_predict(batch_texts)
+            if preds is None:
+                logger.warning(f"Model unavailable, storing {len(all_texts) - i} items unscored.")
+                break
             # Update the corresponding data_list entries
             for j, pred in enumerate(preds):
-                data_list[i + j]['sentiment'] = pred
+                misses[i + j]['sentiment'] = pred
         except Exception as e:
+            # stored without a sentiment, rescorer.py scores them later
             logger.error(f"Failed batch {i//batch_size + 1}: {e}")
+    timings["inference"] = time.perf_counter() - start_time
 
+    logger.info(
+        f"Poll timings for {len(data_list)} items from {feed.url}: " +
+        ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in timings.items()))
     logging.info(f"Returning {len(data_list)} news items.")
-    return data_list
+    return data_list, validators
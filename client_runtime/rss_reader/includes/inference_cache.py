@@ -0,0 +1,121 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from includes.metrics import INFERENCE_CACHE_ENTRIES, INFERENCE_CACHE_LOOKUPS
+
+
+logger = logging.getLogger("inference_cache")
+
+# SQLite file kept across restarts, mount a volume on its directory
+INFERENCE_CACHE_PATH = os.getenv("INFERENCE_CACHE_PATH", "/app/cache/inference.sqlite3")
+# least recently used predictions beyond this are evicted, 0 disables the cache
+INFERENCE_CACHE_MAX_ENTRIES = int(os.getenv("INFERENCE_CACHE_MAX_ENTRIES", "100000"))
+# sqlite allows 999 bound parameters per statement in older builds
+LOOKUP_CHUNK = 500
+
+
+def title_key(title):
+    """sha256 of the title as the uncased tokenizer sees it"""
+    return hashlib.sha256(" ".join(title.split()).lower().encode("utf-8")).hexdigest()
+
+
+class InferenceCache:
+    """Predictions by title hash for one model version, in SQLite.
+
+    Rows of any other model version are deleted as soon as a different
+    version is seen, so a newly served model never gets old predictions.
+    """
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self.version = None
+        self._size = 0
+        self._conn = None
+        self._lock = threading.Lock()
+        INFERENCE_CACHE_ENTRIES.set_function(lambda: self._size)
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS predictions (
+                    model_version TEXT NOT NULL,
+                    title_hash TEXT NOT NULL,
+                    prediction TEXT NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model_version, title_hash)
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_predictions_last_used "
+                         "ON predictions (last_used)")
+            self._conn = conn
+        return self._conn
+
+    def _use_version(self, conn, version):
+        if version == self.version:
+            return
+        with conn:
+            dropped = conn.execute("DELETE FROM predictions WHERE model_version != ?",
+                                   (version,)).rowcount
+        self._size = conn.execute("SELECT count(*) FROM predictions").fetchone()[0]
+        if self.version is not None or dropped:
+            logger.info(f"Model version is now {version}, dropped {dropped} cached predictions.")
+        self.version = version
+
+    def get_many(self, titles, version):
+        """Cached predictions of `version` for the titles that have one, by title"""
+        if not self.max_entries or not titles:
+            return {}
+        keys = {title: title_key(title) for title in titles}
+        predictions = {}
+        with self._lock:
+            conn = self._connect()
+            self._use_version(conn, version)
+            hashes = list(set(keys.values()))
+            for i in range(0, len(hashes), LOOKUP_CHUNK):
+                chunk = hashes[i:i + LOOKUP_CHUNK]
+                rows = conn.execute(
+                    "SELECT title_hash, prediction FROM predictions "
+                    f"WHERE model_version = ? AND title_hash IN ({','.join('?' * len(chunk))})",
+                    [version, *chunk])
+                predictions.update((key, json.loads(value)) for key, value in rows)
+            if predictions:
+                with conn:
+                    conn.executemany(
+                        "UPDATE predictions SET last_used = ? "
+                        "WHERE model_version = ? AND title_hash = ?",
+                        [(time.time(), version, key) for key in predictions])
+        hits = {title: predictions[key] for title, key in keys.items() if key in predictions}
+        INFERENCE_CACHE_LOOKUPS.labels(result="hit").inc(len(hits))
+        INFERENCE_CACHE_LOOKUPS.labels(result="miss").inc(len(keys) - len(hits))
+        return hits
+
+    def put_many(self, pairs, version):
+        """Store (title, prediction) pairs made by `version` and evict down to max_entries"""
+        if not self.max_entries:
+            return
+        now = time.time()
+        rows = {title_key(title): json.dumps(prediction) for title, prediction in pairs}
+        with self._lock:
+            conn = self._connect()
+            self._use_version(conn, version)
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)",
+                    [(version, key, value, now) for key, value in rows.items()])
+                self._size = conn.execute("SELECT count(*) FROM predictions").fetchone()[0]
+                if self._size > self.max_entries:
+                    conn.execute(
+                        "DELETE FROM predictions WHERE rowid IN "
+                        "(SELECT rowid FROM predictions ORDER BY last_used LIMIT ?)",
+                        (self._size - self.max_entries,))
+                    self._size = self.max_entries
@@ -0,0 +1,53 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+
+POLL_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+SIZE_BUCKETS = (4096, 16384, 32768, 65536, 131072, 262144, 524288, 1048576, 4194304)
+
+
+# Prometheus metrics, labelled by feed url
+FEED_POLLS = Counter("rss_feed_polls_total",
+                     "Feed polls by outcome (success, error)", ["feed", "status"])
+FEED_POLL_LATENCY = Histogram("rss_feed_poll_duration_seconds",
+                              "Time from fetching a feed to committing its articles",
+                              ["feed"], buckets=POLL_BUCKETS)
+FEED_ITEMS = Counter("rss_feed_items_total",
+                     "New entries parsed from a feed, after skipping seen ones", ["feed"])
+FEED_INSERTED = Counter("rss_feed_articles_inserted_total",
+                        "New articles stored from a feed", ["feed"])
+FEED_LAST_SUCCESS = Gauge("rss_feed_last_success_timestamp_seconds",
+                          "Unix time of the last successful poll", ["feed"])
+FEED_CONSECUTIVE_FAILURES = Gauge("rss_feed_consecutive_failures",
+                                  "Failed polls since the last success", ["feed"])
+POLLS_IN_FLIGHT = Gauge("rss_feed_polls_in_flight",
+                        "Feed polls currently running")
+IMAGE_BYTES = Histogram("rss_image_bytes",
+                        "Image size as downloaded and as stored", ["stage"],
+                        buckets=SIZE_BUCKETS)
+IMAGE_FAILURES = Counter("rss_image_failures_total",
+                         "Images dropped by reason (http, download, decode)", ["reason"])
+PIPELINE_QUEUE_DEPTH = Gauge("rss_pipeline_queue_depth",
+                             "Items waiting in front of a pipeline stage", ["stage"])
+PIPELINE_ITEMS = Counter("rss_pipeline_items_total",
+                         "Items leaving a pipeline stage by outcome (ok, error, cached, skipped)",
+                         ["stage", "status"])
+PIPELINE_STAGE_LATENCY = Histogram("rss_pipeline_stage_duration_seconds",
+                                   "Time a stage spends on one item or batch", ["stage"])
+PIPELINE_BATCH_SIZE = Histogram("rss_pipeline_batch_size",
+                                "Items per inference request or database write", ["stage"],
+                                buckets=BATCH_BUCKETS)
+HTTP_RETRIES = Counter("rss_http_retries_total",
+                       "HTTP requests retried, by client and status code or error",
+                       ["client", "reason"])
+ARTICLES_RESCORED = Counter("rss_articles_rescored_total",
+                            "Articles stored without a sentiment and scored later")
+UNSCORED_ARTICLES = Gauge("rss_unscored_articles",
+                          "Articles waiting for a sentiment, as of the last rescore run")
+INFERENCE_CACHE_LOOKUPS = Counter("rss_inference_cache_lookups_total",
+                                  "Titles looked up in the inference cache (hit, miss)",
+                                  ["result"])
+INFERENCE_CACHE_ENTRIES = Gauge("rss_inference_cache_entries",
+                                "Predictions held in the inference cache")
+CIRCUIT_OPEN = Gauge("rss_circuit_open",
+                     "1 while calls to a service are skipped after a failure", ["service"])
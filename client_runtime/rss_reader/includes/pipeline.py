@@ -0,0 +1,215 @@
+import logging
+import os
+import queue
+import threading
+import time
+import includes.image_utils as iu
+from includes import fetcher
+from includes.db_utils import push
+from includes.seen_index import entry_key
+from includes.metrics import (PIPELINE_BATCH_SIZE, PIPELINE_ITEMS, PIPELINE_QUEUE_DEPTH,
+                              PIPELINE_STAGE_LATENCY)
+
+
+logger = logging.getLogger("pipeline")
+
+# items each stage may have queued in front of it before producers block
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "256"))
+# image downloads handed to the per-host pools at once
+PIPELINE_IMAGES_IN_FLIGHT = int(os.getenv("PIPELINE_IMAGES_IN_FLIGHT", "64"))
+# inference requests sent to the model proxy at once
+PIPELINE_INFER_WORKERS = int(os.getenv("PIPELINE_INFER_WORKERS", "2"))
+# seconds a partial batch waits for more items before it is sent anyway
+PIPELINE_INFER_WAIT = float(os.getenv("PIPELINE_INFER_WAIT", "0.2"))
+PIPELINE_DB_BATCH_SIZE = int(os.getenv("PIPELINE_DB_BATCH_SIZE", "200"))
+# items arriving while a write is in progress make up the next batch
+PIPELINE_DB_WAIT = float(os.getenv("PIPELINE_DB_WAIT", "0"))
+
+
+class Poll:
+    """Completion tracker for the items one feed poll put into the pipeline"""
+
+    def __init__(self, size):
+        self.inserted = 0
+        self.errors = []
+        self._pending = size
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        if size == 0:
+            self._done.set()
+
+    def item_done(self, inserted=False, error=None):
+        with self._lock:
+            self.inserted += bool(inserted)
+            if error is not None:
+                self.errors.append(error)
+            self._pending -= 1
+            if self._pending == 0:
+                self._done.set()
+
+    def wait(self):
+        self._done.wait()
+        return self
+
+
+def take_batch(items, max_items, wait):
+    """Block for one item, then collect up to `max_items`: waiting up to `wait`
+    seconds for more, and after that taking only what is already queued"""
+    batch = [items.get()]
+    deadline = time.monotonic() + wait
+    while len(batch) < max_items:
+        remaining = deadline - time.monotonic()
+        try:
+            batch.append(items.get(timeout=remaining) if remaining > 0 else items.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+class Pipeline:
+    """Long-lived image -> inference -> database stages shared by all feeds.
+
+    Feed workers parse their feed and submit the new items; each stage then
+    works on whatever is ready, so images of one item download while earlier
+    items are scored and written. Every queue is bounded, so a slow stage
+    blocks the ones before it (down to the feed workers) instead of letting
+    work pile up in memory.
+    """
+
+    def __init__(self):
+        self.image_queue = queue.Queue(PIPELINE_QUEUE_SIZE)
+        self.infer_queue = queue.Queue(PIPELINE_QUEUE_SIZE)
+        self.db_queue = queue.Queue(PIPELINE_QUEUE_SIZE)
+        self._image_slots = threading.BoundedSemaphore(PIPELINE_IMAGES_IN_FLIGHT)
+        for stage, items in (("images", self.image_queue), ("inference", self.infer_queue),
+                             ("db", self.db_queue)):
+            PIPELINE_QUEUE_DEPTH.labels(stage=stage).set_function(items.qsize)
+
+    def start(self):
+        threads = [("pipeline-images", self._image_loop), ("pipeline-db", self._db_loop)]
+        threads += [(f"pipeline-inference-{i}", self._infer_loop)
+                    for i in range(PIPELINE_INFER_WORKERS)]
+        for name, target in threads:
+            threading.Thread(target=target, name=name, daemon=True).start()
+        logger.info(f"Pipeline started with {PIPELINE_INFER_WORKERS} inference workers.")
+
+    def submit(self, data_list):
+        """Queue a poll's parsed items, blocking while the pipeline is full"""
+        poll = Poll(len(data_list))
+        cached = fetcher.cached_predictions([data["title"] for data in data_list])
+        for data in data_list:
+            if data["title"] in cached:
+                data["sentiment"] = cached[data["title"]]
+            self.image_queue.put((poll, data))
+            PIPELINE_ITEMS.labels(stage="parse", status="ok").inc()
+        return poll
+
+    def _image_loop(self):
+        while True:
+            poll, data = self.image_queue.get()
+            if not data["image_url"]:
+                self._images_done(poll, data)
+                continue
+            self._image_slots.acquire()
+            try:
+                future = iu.submit_image(data["image_url"])
+            except Exception as e:
+                self._image_slots.release()
+                logger.error(f"Could not queue image {data['image_url']}: {e}")
+                self._image_done(None, poll, data)
+                continue
+            future.add_done_callback(
+                lambda future, poll=poll, data=data: self._image_done(future, poll, data))
+
+    def _image_done(self, future, poll, data):
+        """Runs on the host pool thread; blocking here holds back further downloads"""
+        try:
+            data["image"], seconds = future.result() if future else (None, 0.0)
+            PIPELINE_STAGE_LATENCY.labels(stage="images").observe(seconds)
+            PIPELINE_ITEMS.labels(stage="images", status="ok" if data["image"] else "error").inc()
+        except Exception as e:
+            # a missing image never holds back the article
+            logger.error(f"Image download for {data['image_url']} failed: {e}")
+            data["image"] = None
+            PIPELINE_ITEMS.labels(stage="images", status="error").inc()
+        self._images_done(poll, data)
+        if future is not None:
+            self._image_slots.release()
+
+    def _images_done(self, poll, data):
+        # items with a cached prediction skip inference
+        if "sentiment" in data:
+            PIPELINE_ITEMS.labels(stage="inference", status="cached").inc()
+            self.db_queue.put((poll, data))
+        else:
+            self.infer_queue.put((poll, data))
+
+    def _infer_loop(self):
+        while True:
+            batch = take_batch(self.infer_queue, fetcher.batch_size, PIPELINE_INFER_WAIT)
+            PIPELINE_BATCH_SIZE.labels(stage="inference").observe(len(batch))
+            start_time = time.perf_counter()
+            try:
+                preds = fetcher.guarded_predict([data["title"] for _, data in batch])
+                if preds is None:
+                    # the model is failing, don't wait on it; the rescorer catches up
+                    PIPELINE_ITEMS.labels(stage="inference", status="skipped").inc(len(batch))
+                    for item in batch:
+                        self.db_queue.put(item)
+                    continue
+                if len(preds) != len(batch):
+                    raise ValueError(f"{len(preds)} predictions for {len(batch)} titles")
+            except Exception as e:
+                # stored unscored, the rescorer scores them once the model is back
+                logger.error(f"Inference for {len(batch)} items failed, storing them unscored: {e}")
+                PIPELINE_ITEMS.labels(stage="inference", status="error").inc(len(batch))
+                for item in batch:
+                    self.db_queue.put(item)
+                continue
+            finally:
+                PIPELINE_STAGE_LATENCY.labels(stage="inference").observe(
+                    time.perf_counter() - start_time)
+            PIPELINE_ITEMS.labels(stage="inference", status="ok").inc(len(batch))
+            for (poll, data), pred in zip(batch, preds):
+                data["sentiment"] = pred
+                self.db_queue.put((poll, data))
+
+    def _db_loop(self):
+        while True:
+            batch = take_batch(self.db_queue, PIPELINE_DB_BATCH_SIZE, PIPELINE_DB_WAIT)
+            PIPELINE_BATCH_SIZE.labels(stage="db").observe(len(batch))
+            start_time = time.perf_counter()
+            try:
+                self._write(batch)
+            finally:
+                PIPELINE_STAGE_LATENCY.labels(stage="db").observe(
+                    time.perf_counter() - start_time)
+
+    def _write(self, batch):
+        """Push a batch of items from any number of polls. If the write fails,
+        each poll's items and then each item are pushed on their own, so one
+        bad item only fails itself rather than every feed in the batch."""
+        data_list = [data for _, data in batch]
+        try:
+            push(data_list)
+        except Exception as e:
+            by_poll = {}
+            for poll, data in batch:
+                by_poll.setdefault(poll, []).append((poll, data))
+            if len(by_poll) > 1:
+                parts = list(by_poll.values())
+            elif len(batch) > 1:
+                parts = [[item] for item in batch]
+            else:
+                PIPELINE_ITEMS.labels(stage="db", status="error").inc()
+                logger.error(f"Could not store {data_list[0]['title']!r}: {e}")
+                batch[0][0].item_done(error=e)
+                return
+            logger.warning(f"Write of {len(batch)} items failed, retrying in {len(parts)} parts.")
+            for part in parts:
+                self._write(part)
+            return
+        PIPELINE_ITEMS.labels(stage="db", status="ok").inc(len(batch))
+        fetcher.SEEN_ENTRIES.add_all(entry_key(data) for data in data_list)
+        for poll, data in batch:
+            poll.item_done(inserted=data["id"] is not None)
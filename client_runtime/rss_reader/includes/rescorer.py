@@ -0,0 +1,61 @@
+import logging
+import os
+from includes import fetcher
+from includes.db_utils import count_unscored, load_unscored, store_scores
+from includes.metrics import ARTICLES_RESCORED, UNSCORED_ARTICLES
+
+
+logger = logging.getLogger("rescorer")
+
+# seconds between looking for articles stored without a sentiment
+RESCORE_INTERVAL = int(os.getenv("RESCORE_INTERVAL", "120"))
+# unscored articles read and written back per round
+RESCORE_BATCH_SIZE = int(os.getenv("RESCORE_BATCH_SIZE", "512"))
+# titles per inference request
+RESCORE_PREDICT_BATCH = int(os.getenv("RESCORE_PREDICT_BATCH", "64"))
+
+
+def score(rows):
+    """(id, sentiment) for as many of the (id, title) rows as can be scored,
+    and the error that stopped scoring early, if any"""
+    cached = fetcher.cached_predictions([title for _, title in rows])
+    scores = [(article_id, cached[title]) for article_id, title in rows if title in cached]
+    misses = [(article_id, title) for article_id, title in rows if title not in cached]
+    for i in range(0, len(misses), RESCORE_PREDICT_BATCH):
+        batch = misses[i:i + RESCORE_PREDICT_BATCH]
+        try:
+            preds = fetcher.predict([title for _, title in batch])
+            if len(preds) != len(batch):
+                raise ValueError(f"{len(preds)} predictions for {len(batch)} titles")
+        except Exception as e:
+            return scores, e
+        scores.extend((article_id, pred) for (article_id, _), pred in zip(batch, preds))
+    return scores, None
+
+
+def rescore():
+    """Scheduler job: score articles stored while inference was failing.
+
+    Works through the backlog oldest first and stops at the first failed
+    inference request, leaving the rest for the next run.
+    """
+    scored = 0
+    try:
+        while True:
+            rows = load_unscored(RESCORE_BATCH_SIZE)
+            if not rows:
+                break
+            scores, error = score(rows)
+            stored = store_scores(scores)
+            scored += stored
+            ARTICLES_RESCORED.inc(stored)
+            if error is not None:
+                logger.warning(f"Rescoring stopped, model still failing: {error}")
+                break
+            if len(rows) < RESCORE_BATCH_SIZE:
+                break
+        UNSCORED_ARTICLES.set(count_unscored())
+    except Exception as e:
+        logger.error(f"Rescoring failed: {e}")
+    if scored:
+        logger.info(f"Rescored {scored} articles.")
@@ -0,0 +1,38 @@
+import threading
+from collections import OrderedDict
+
+
+class SeenIndex:
+    """Bounded, thread-safe set of (title, pub_time) keys already stored.
+
+    Keys match the articles table's unique (title, publication_timestamp)
+    constraint, with pub_time formatted the way rss_parser formats it. The
+    oldest keys are evicted first; an evicted entry that shows up again is
+    still deduplicated by the database.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add_all(self, keys):
+        with self._lock:
+            for key in keys:
+                self._keys[key] = None
+                self._keys.move_to_end(key)
+            while len(self._keys) > self.max_entries:
+                self._keys.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._keys
+
+    def __len__(self):
+        with self._lock:
+            return len(self._keys)
+
+
+def entry_key(data):
+    """Seen-index key of a parsed feed item"""
+    return (data["title"], data["pub_time"])
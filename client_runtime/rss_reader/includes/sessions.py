@@ -0,0 +1,124 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from prometheus_client import REGISTRY
+from prometheus_client.core import CounterMetricFamily
+from includes.metrics import HTTP_RETRIES
+
+
+# attempts after the first for connection errors and retryable statuses
+HTTP_RETRIES_TOTAL = int(os.getenv("HTTP_RETRIES", "3"))
+# retry n sleeps HTTP_BACKOFF * 2**(n-1) seconds plus up to HTTP_BACKOFF_JITTER
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.5"))
+HTTP_BACKOFF_JITTER = float(os.getenv("HTTP_BACKOFF_JITTER", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "10"))
+# idle keep-alive connections kept per host, and hosts with a kept pool
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP_POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", "64"))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# adapter of every session, by client name, for PoolCollector
+_adapters = {}
+
+
+class CountingRetry(Retry):
+    """Retry that counts every retry it allows in HTTP_RETRIES"""
+
+    def __init__(self, *args, client="default", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.client = client
+
+    def new(self, **kwargs):
+        retry = super().new(**kwargs)
+        retry.client = self.client
+        return retry
+
+    def increment(self, method=None, url=None, response=None, error=None,
+                  _pool=None, _stacktrace=None):
+        # raises MaxRetryError once the retries are used up
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        reason = str(response.status) if response is not None else type(error).__name__
+        HTTP_RETRIES.labels(client=self.client, reason=reason).inc()
+        return retry
+
+
+class CountingAdapter(HTTPAdapter):
+    """HTTPAdapter that keeps the connection counts of the pools it closes"""
+
+    def __init__(self, *args, **kwargs):
+        self._closed = [0, 0]
+        self._closed_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        pools = self.poolmanager.pools
+        dispose = pools.dispose_func
+
+        def retire(pool):
+            with self._closed_lock:
+                self._closed[0] += pool.num_connections
+                self._closed[1] += pool.num_requests
+            dispose(pool)
+        pools.dispose_func = retire
+
+    def stats(self):
+        """(connections opened, requests sent) over the adapter's lifetime"""
+        pools = self.poolmanager.pools
+        with self._closed_lock:
+            connections, requests_sent = self._closed
+            for key in pools.keys():
+                try:
+                    pool = pools[key]
+                except KeyError:
+                    continue
+                connections += pool.num_connections
+                requests_sent += pool.num_requests
+        return connections, requests_sent
+
+
+def make_session(client, retry_methods=Retry.DEFAULT_ALLOWED_METHODS,
+                 retries=HTTP_RETRIES_TOTAL):
+    """Keep-alive session whose adapter retries `retry_methods` with jittered backoff"""
+    retry = CountingRetry(
+        total=retries, backoff_factor=HTTP_BACKOFF,
+        backoff_jitter=HTTP_BACKOFF_JITTER, backoff_max=HTTP_BACKOFF_MAX,
+        status_forcelist=RETRY_STATUSES, allowed_methods=retry_methods,
+        raise_on_status=False, client=client)
+    adapter = CountingAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_SIZE,
+                              max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    _adapters[client] = adapter
+    return session
+
+
+class PoolCollector:
+    """Connections opened against requests sent, per client; few connections
+    for many requests means keep-alive is doing its job"""
+
+    def collect(self):
+        opened = CounterMetricFamily("rss_http_connections_opened",
+                                     "New HTTP connections opened", labels=["client"])
+        sent = CounterMetricFamily("rss_http_requests",
+                                   "HTTP requests sent, including retries", labels=["client"])
+        for client, adapter in _adapters.items():
+            connections, requests_sent = adapter.stats()
+            opened.add_metric([client], connections)
+            sent.add_metric([client], requests_sent)
+        yield opened
+        yield sent
+
+
+REGISTRY.register(PoolCollector())
+
+# shared by every thread; requests' adapters hand each request its own connection
+feed_session = make_session("feeds")
+image_session = make_session("images")
+# a prediction has no side effects, so a failed POST is safe to send again
+model_session = make_session("model", Retry.DEFAULT_ALLOWED_METHODS | {"POST"})
+# tests the model proxy once while inference is failing, so no retries
+model_probe_session = make_session("model-probe", retries=0)
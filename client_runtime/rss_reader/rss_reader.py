@@ -1,35 +1,125 @@
+from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.schedulers.blocking import BlockingScheduler
-from datetime import datetime
-from includes.fetcher import fetch_rss
-from includes.db_utils import push
+from datetime import datetime, timedelta
+from prometheus_client import start_http_server
+from includes.fetcher import SEEN_ENTRIES, fetch_feed, fetch_rss
+from includes.db_utils import load_seen, push
+from includes.feeds import load_feeds
+from includes.pipeline import Pipeline
+from includes.rescorer import RESCORE_INTERVAL, rescore
+from includes.seen_index import entry_key
+from includes.metrics import (FEED_CONSECUTIVE_FAILURES, FEED_INSERTED, FEED_ITEMS,
+                              FEED_LAST_SUCCESS, FEED_POLL_LATENCY, FEED_POLLS,
+                              POLLS_IN_FLIGHT)
 import logging
 import logger_config
 import os
+import time
 
 
 # setting the logger
 logger_config.set_logger()
 logger = logging.getLogger("rss_reader")
-# poll interval for scheduler
-POLL_INTERVAL = int(os.getenv("POLL_INTERVAL"))
 # grace tolerance in case scheduler misses the next firing time
 GRACE_TOL = int(os.getenv("GRACE_TOL"))
+# number of feeds polled at the same time
+FEED_WORKERS = int(os.getenv("FEED_WORKERS", "8"))
+# port serving the reader's Prometheus metrics
+READER_METRICS_PORT = int(os.getenv("READER_METRICS_PORT", "9001"))
+# days of stored articles loaded into the seen-entry index at start-up
+SEEN_WARM_DAYS = int(os.getenv("SEEN_WARM_DAYS", "7"))
+# "pipeline" overlaps image, inference and database work across items and
+# feeds, "batch" finishes each step for a whole feed before the next
+READER_MODE = os.getenv("READER_MODE", "pipeline")
 
+PIPELINE = Pipeline()
 
-def worker():
-    """Function executed by the scheduler"""
-    logger.info("Fetching rss feed...")
-    data = fetch_rss()
-    push(data)
-    logger.info("Pushed to db successfully.")
+
+def poll_batch(feed):
+    """Run one poll step by step, returning (new articles, validators)"""
+    inserted = 0
+    data, validators = fetch_rss(feed)
+    if data:
+        FEED_ITEMS.labels(feed=feed.url).inc(len(data))
+        inserted = push(data)
+        FEED_INSERTED.labels(feed=feed.url).inc(inserted)
+        SEEN_ENTRIES.add_all(entry_key(item) for item in data)
+    return inserted, validators
+
+
+def poll_pipeline(feed):
+    """Parse a feed into the pipeline and wait for its items to be stored,
+    returning (new articles, validators)"""
+    data, validators = fetch_feed(feed)
+    FEED_ITEMS.labels(feed=feed.url).inc(len(data))
+    poll = PIPELINE.submit(data).wait()
+    FEED_INSERTED.labels(feed=feed.url).inc(poll.inserted)
+    if poll.errors:
+        # stored items are in the seen index, the next poll retries the rest
+        raise RuntimeError(f"{len(poll.errors)} of {len(data)} items failed, "
+                           f"first error: {poll.errors[0]}")
+    return poll.inserted, validators
+
+
+def worker(feed):
+    """Function executed by the scheduler for one feed.
+
+    Errors are recorded against the feed and not raised, so one failing
+    feed never affects the others.
+    """
+    POLLS_IN_FLIGHT.inc()
+    start_time = time.perf_counter()
+    try:
+        if READER_MODE == "batch":
+            inserted, validators = poll_batch(feed)
+        else:
+            inserted, validators = poll_pipeline(feed)
+    except Exception as e:
+        failures = feed.record_failure(e)
+        FEED_POLLS.labels(feed=feed.url, status="error").inc()
+        FEED_CONSECUTIVE_FAILURES.labels(feed=feed.url).set(failures)
+        logger.error(f"Polling {feed.url} failed ({failures} in a row): {e}")
+    else:
+        feed.record_success(validators)
+        FEED_POLLS.labels(feed=feed.url, status="success").inc()
+        FEED_CONSECUTIVE_FAILURES.labels(feed=feed.url).set(0)
+        FEED_LAST_SUCCESS.labels(feed=feed.url).set(feed.last_success)
+        logger.info(f"Polled {feed.url}, {inserted} new articles.")
+    finally:
+        FEED_POLL_LATENCY.labels(feed=feed.url).observe(time.perf_counter() - start_time)
+        POLLS_IN_FLIGHT.dec()
 
 
 def main():
     """Function to set-up the scheduler"""
     print("RSS Reader started. Press CTRL+C to stop.")
-    scheduler = BlockingScheduler()
-    scheduler.add_job(worker, 'interval', seconds=POLL_INTERVAL,
-                      next_run_time=datetime.now(), misfire_grace_time=GRACE_TOL)
+    feeds = load_feeds()
+    try:
+        SEEN_ENTRIES.add_all(load_seen(SEEN_WARM_DAYS))
+        logger.info(f"Loaded {len(SEEN_ENTRIES)} seen entries.")
+    except Exception as e:
+        # only costs duplicate work, the database still rejects duplicates
+        logger.error(f"Could not warm the seen-entry index: {e}")
+    start_http_server(READER_METRICS_PORT)
+    if READER_MODE != "batch":
+        PIPELINE.start()
+    # a slow feed holds one worker; max_instances keeps it from piling up runs
+    scheduler = BlockingScheduler(
+        executors={"default": ThreadPoolExecutor(FEED_WORKERS),
+                   "rescore": ThreadPoolExecutor(1)},
+        job_defaults={"coalesce": True, "max_instances": 1,
+                      "misfire_grace_time": GRACE_TOL})
+    now = datetime.now()
+    for i, feed in enumerate(feeds):
+        # spread first runs over each feed's interval so polls do not bunch up
+        first_run = now + timedelta(seconds=feed.interval * i / len(feeds))
+        scheduler.add_job(worker, 'interval', args=[feed], id=feed.url,
+                          name=feed.url, seconds=feed.interval,
+                          next_run_time=first_run)
+    # articles stored without a sentiment while the model proxy was failing
+    scheduler.add_job(rescore, 'interval', id="rescore", name="rescore",
+                      executor="rescore", seconds=RESCORE_INTERVAL, next_run_time=now)
+    logger.info(f"Polling {len(feeds)} feed(s) with {FEED_WORKERS} workers.")
     try:
         scheduler.start()
     except (KeyboardInterrupt, SystemExit):
@@ -1,9 +1,18 @@
+import os
 import mlflow.pyfunc
+import numpy as np
 import torch
 from transformers import AutoTokenizer
 from includes.model import TinyBERTClassifier
 
 
+# "longest" pads each batch to its longest title, "max_length" to MAX_LENGTH
+PADDING = os.getenv("TOKENIZER_PADDING", "longest")
+MAX_LENGTH = 32
+# requests with more titles than this run as batches of similar length
+LENGTH_BUCKET_SIZE = int(os.getenv("LENGTH_BUCKET_SIZE", "64"))
+
+
 class SentimentModelWrapper(mlflow.pyfunc.PythonModel):
     def load_context(self, context):
         self.device = torch.device("cpu")
@@ -13,18 +22,45 @@ class SentimentModelWrapper(mlflow.pyfunc.PythonModel):
             context.artifacts["model_path"], map_location=self.device))
         self.model.eval()
 
+    def tokenize(self, texts):
+        """Model inputs for a list of titles, as (positions, encodings) batches.
+
+        With "longest" padding a batch is only padded to its longest title.
+        Requests of more than LENGTH_BUCKET_SIZE titles are also sorted by
+        token count and cut into batches of similar length, so short titles
+        are not padded to the length of the long ones.
+        """
+        if PADDING == "max_length" or len(texts) <= LENGTH_BUCKET_SIZE:
+            encodings = self.tokenizer(
+                texts,
+                padding=PADDING,
+                truncation=True,
+                max_length=MAX_LENGTH,
+                return_tensors="pt"
+            )
+            return [(list(range(len(texts))), encodings)]
+        encoded = self.tokenizer(texts, truncation=True, max_length=MAX_LENGTH)
+        order = sorted(range(len(texts)), key=lambda i: len(encoded["input_ids"][i]))
+        batches = []
+        for start in range(0, len(order), LENGTH_BUCKET_SIZE):
+            positions = order[start:start + LENGTH_BUCKET_SIZE]
+            bucket = {key: [encoded[key][i] for i in positions]
+                      for key in ("input_ids", "attention_mask")}
+            batches.append((positions, self.tokenizer.pad(
+                bucket, padding="longest", return_tensors="pt")))
+        return batches
+
+    def forward(self, batches):
+        """Predicted class of each title in request order, as a numpy array"""
+        preds = np.empty(sum(len(positions) for positions, _ in batches), dtype=np.int64)
+        with torch.no_grad():
+            for positions, encodings in batches:
+                logits = self.model(
+                    encodings["input_ids"], encodings["attention_mask"])
+                preds[positions] = torch.argmax(logits, dim=1).numpy()
+        return preds
+
     def predict(self, context, model_input):
         texts = model_input["text"][0].tolist()
         print(texts)
-        encodings = self.tokenizer(
-            texts,
-            padding="max_length",
-            truncation=True,
-            max_length=32,
-            return_tensors="pt"
-        )
-        with torch.no_grad():
-            logits = self.model(
-                encodings["input_ids"], encodings["attention_mask"])
-            preds = torch.argmax(logits, dim=1)
-        return preds.numpy()
+        return self.forward(self.tokenize(texts))
@@ -0,0 +1,97 @@
+"""Titles/sec of SentimentModelWrapper with fixed and dynamic padding.
+
+Runs the same titles through the wrapper padded to max_length, padded to
+the longest title of each request, and with length buckets, and reports
+throughput per request size and how many predictions differ from the
+max_length run (padding is masked, so only float noise should differ).
+
+Titles are read one per line from --titles, e.g. real headlines exported
+from the client database with
+
+    psql -d mlops_app -c "\\copy (SELECT title FROM articles) TO 'titles.txt'"
+
+or, without --titles, from the "text" column of combined_dataset.csv.
+
+    python bench_padding.py [--titles titles.txt] [--batch-sizes 16 64 256]
+"""
+import argparse
+import csv
+import time
+import numpy as np
+import torch
+from transformers import AutoTokenizer
+import inference_wrapper
+from inference_wrapper import SentimentModelWrapper
+from model import TinyBERTClassifier
+
+
+# mode -> (padding, length bucket size)
+MODES = {
+    "max_length": ("max_length", inference_wrapper.LENGTH_BUCKET_SIZE),
+    "longest": ("longest", float("inf")),
+    "buckets": ("longest", inference_wrapper.LENGTH_BUCKET_SIZE),
+}
+
+
+def load_titles(path):
+    if path:
+        with open(path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    with open("combined_dataset.csv", encoding="utf-8", newline="") as f:
+        return [row["text"] for row in csv.DictReader(f) if row["text"].strip()]
+
+
+def load_wrapper(weights):
+    """The wrapper as load_context would set it up, without an MLflow run"""
+    wrapper = SentimentModelWrapper()
+    wrapper.device = torch.device("cpu")
+    wrapper.tokenizer = AutoTokenizer.from_pretrained("prajjwal1/bert-tiny")
+    wrapper.model = TinyBERTClassifier()
+    if weights:
+        wrapper.model.load_state_dict(torch.load(weights, map_location=wrapper.device))
+    wrapper.model.eval()
+    return wrapper
+
+
+def run(wrapper, titles, batch_size, mode):
+    """(titles/sec, predictions) for all titles sent in requests of batch_size"""
+    inference_wrapper.PADDING, inference_wrapper.LENGTH_BUCKET_SIZE = MODES[mode]
+    preds = []
+    start = time.perf_counter()
+    for i in range(0, len(titles), batch_size):
+        preds.append(wrapper.forward(wrapper.tokenize(titles[i:i + batch_size])))
+    return len(titles) / (time.perf_counter() - start), np.concatenate(preds)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--titles", help="file with one title per line")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--limit", type=int, default=4096, help="titles to use")
+    parser.add_argument("--weights", help="trained state dict, e.g. artifacts/tinybert.pt")
+    parser.add_argument("--rounds", type=int, default=3, help="best of this many runs")
+    args = parser.parse_args()
+
+    titles = load_titles(args.titles)[:args.limit]
+    wrapper = load_wrapper(args.weights)
+    lengths = [len(ids) for ids in wrapper.tokenizer(
+        titles, truncation=True, max_length=inference_wrapper.MAX_LENGTH)["input_ids"]]
+    print(f"{len(titles)} titles, tokens p50 {np.percentile(lengths, 50):.0f} "
+          f"p90 {np.percentile(lengths, 90):.0f} max {max(lengths)} "
+          f"(max_length {inference_wrapper.MAX_LENGTH})")
+    run(wrapper, titles[:64], 64, "longest")  # warm-up
+
+    print(f"{'batch':>6}{'mode':>12}{'titles/sec':>12}{'speed-up':>10}{'changed':>9}")
+    for batch_size in args.batch_sizes:
+        results = {}
+        for mode in MODES:
+            runs = [run(wrapper, titles, batch_size, mode) for _ in range(args.rounds)]
+            results[mode] = (max(rate for rate, _ in runs), runs[0][1])
+        base_rate, base_preds = results["max_length"]
+        for mode, (rate, preds) in results.items():
+            changed = int((preds != base_preds).sum())
+            print(f"{batch_size:>6}{mode:>12}{rate:>12,.0f}{rate / base_rate:>9.2f}x{changed:>9}")
+
+
+if __name__ == "__main__":
+    main()
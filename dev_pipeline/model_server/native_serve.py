@@ -0,0 +1,196 @@
+"""In-process model server.
+
+Loads SentimentModelWrapper once per worker and calls its tokenize/forward
+helpers directly, skipping MLflow's scoring server and its DataFrame
+conversion. Endpoints:
+
+    POST /invocations      MLflow scoring protocol (instances, inputs,
+                           dataframe_records, dataframe_split)
+    POST /predict          {"texts": [...]} -> {"predictions": [...]}
+    POST /predict/binary   UTF-8 titles, one per line -> one byte per prediction
+
+Started by serve.py when SERVE_MODE=native, or directly with
+    uvicorn native_serve:app --host 0.0.0.0 --port 5001 --workers 2
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import mlflow
+import torch
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter,
+                               Histogram, generate_latest, multiprocess)
+
+
+log_dir = "/app/logs"
+os.makedirs(log_dir, exist_ok=True)
+log_file = os.path.join(log_dir, "model_serving.log")
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(),
+        logging.FileHandler(log_file, encoding='utf-8')
+    ]
+)
+
+logger = logging.getLogger(__name__)
+
+MLFLOW_PORT = os.getenv("MLFLOW_PORT", "5000")
+MLFLOW_TRACKING_URI = os.getenv("MLFLOW_TRACKING_URI", f"http://mlflow-tracking:{MLFLOW_PORT}")
+MODEL_NAME = "NewsSentiment"
+MODEL_VERSION = os.getenv("MODEL_VERSION", "1")
+# torch threads per worker, 0 keeps torch's default of one per core
+SERVE_TORCH_THREADS = int(os.getenv("SERVE_TORCH_THREADS", "0"))
+
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+# Prometheus metrics, merged across workers through PROMETHEUS_MULTIPROC_DIR
+STAGE_LATENCY = Histogram("model_serving_stage_duration_seconds",
+                          "Time per request in each stage (decode, tokenize, forward, encode)",
+                          ["stage"], buckets=STAGE_BUCKETS)
+BATCH_SIZE = Histogram("model_serving_batch_size",
+                       "Titles per inference request", buckets=BATCH_BUCKETS)
+REQUESTS = Counter("model_serving_requests_total",
+                   "Inference requests by endpoint and outcome (ok, bad_request)",
+                   ["endpoint", "status"])
+
+state = {}
+
+
+def load_wrapper():
+    """SentimentModelWrapper of the registered model, with its context loaded"""
+    mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
+    model_uri = f"models:/{MODEL_NAME}/{MODEL_VERSION}"
+    logger.info(f"Loading model {model_uri} from {MLFLOW_TRACKING_URI}")
+    return mlflow.pyfunc.load_model(model_uri).unwrap_python_model()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if SERVE_TORCH_THREADS:
+        torch.set_num_threads(SERVE_TORCH_THREADS)
+    state["wrapper"] = load_wrapper()
+    # one thread per worker: the tokenizer is not thread-safe and the forward
+    # pass already uses every torch thread
+    state["executor"] = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+    logger.info(f"Serving {MODEL_NAME} version {MODEL_VERSION} in process {os.getpid()}")
+    yield
+    state["executor"].shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def infer(texts):
+    """Tokenize and run the model, on the inference thread"""
+    wrapper = state["wrapper"]
+    start_time = time.perf_counter()
+    encodings = wrapper.tokenize(texts)
+    tokenized = time.perf_counter()
+    preds = wrapper.forward(encodings)
+    STAGE_LATENCY.labels(stage="tokenize").observe(tokenized - start_time)
+    STAGE_LATENCY.labels(stage="forward").observe(time.perf_counter() - tokenized)
+    return preds.tolist()
+
+
+def invocation_texts(body):
+    """Titles from an MLflow scoring request, read the way the wrapper reads
+    its DataFrame: a list in the first row's "text", or one title per row"""
+    payload = json.loads(body)
+    if "dataframe_split" in payload:
+        split = payload["dataframe_split"]
+        rows = [dict(zip(split["columns"], row)) for row in split["data"]]
+    else:
+        rows = next((payload[key] for key in ("instances", "inputs", "dataframe_records")
+                     if key in payload), None)
+    if isinstance(rows, dict):
+        # column-oriented {"text": [...]}
+        return list(rows["text"])
+    if not rows:
+        raise ValueError("no instances, inputs, dataframe_records or dataframe_split")
+    if isinstance(rows[0]["text"], list):
+        return rows[0]["text"]
+    return [row["text"] for row in rows]
+
+
+def predict_texts(body):
+    return list(json.loads(body)["texts"])
+
+
+def binary_texts(body):
+    text = body.decode("utf-8")
+    if not text:
+        return []
+    return text[:-1].split("\n") if text.endswith("\n") else text.split("\n")
+
+
+def json_predictions(preds):
+    return json.dumps({"predictions": preds}).encode("utf-8")
+
+
+async def serve(endpoint, request, decode, encode, media_type):
+    """Decode the body, run the model off the event loop and encode the result"""
+    body = await request.body()
+    start_time = time.perf_counter()
+    try:
+        texts = decode(body)
+        if not all(isinstance(text, str) for text in texts):
+            raise TypeError("every title must be a string")
+    except (ValueError, KeyError, IndexError, TypeError) as e:
+        REQUESTS.labels(endpoint=endpoint, status="bad_request").inc()
+        return JSONResponse(status_code=400,
+                            content={"error_code": "BAD_REQUEST", "message": f"Invalid input: {e}"})
+    STAGE_LATENCY.labels(stage="decode").observe(time.perf_counter() - start_time)
+    BATCH_SIZE.observe(len(texts))
+
+    preds = []
+    if texts:
+        loop = asyncio.get_running_loop()
+        preds = await loop.run_in_executor(state["executor"], infer, texts)
+
+    start_time = time.perf_counter()
+    content = encode(preds)
+    STAGE_LATENCY.labels(stage="encode").observe(time.perf_counter() - start_time)
+    REQUESTS.labels(endpoint=endpoint, status="ok").inc()
+    return Response(content=content, media_type=media_type)
+
+
+@app.post("/invocations")
+async def invocations(request: Request):
+    return await serve("/invocations", request, invocation_texts, json_predictions,
+                       "application/json")
+
+
+@app.post("/predict")
+async def predict(request: Request):
+    return await serve("/predict", request, predict_texts, json_predictions,
+                       "application/json")
+
+
+@app.post("/predict/binary")
+async def predict_binary(request: Request):
+    return await serve("/predict/binary", request, binary_texts, bytes,
+                       "application/octet-stream")
+
+
+@app.get("/ping")
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+
+@app.get("/metrics")
+def metrics():
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
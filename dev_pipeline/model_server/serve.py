@@ -1,5 +1,6 @@
 import subprocess
 import os
+import shutil
 import logging
 from dotenv import load_dotenv
 import mlflow
@@ -24,7 +25,14 @@ logger = logging.getLogger(__name__)
 MLFLOW_PORT = os.getenv("MLFLOW_PORT", "5000")
 MODEL_API_PORT = os.getenv("MLFLOW_API_PORT", "5001")
 MODEL_NAME = "NewsSentiment"
-MODEL_VERSION = 1
+MODEL_VERSION = os.getenv("MODEL_VERSION", "1")
+# "native" serves the model in-process from native_serve.py, "mlflow" through
+# `mlflow models serve`
+SERVE_MODE = os.getenv("SERVE_MODE", "native")
+# native server processes, each with its own copy of the model
+SERVE_WORKERS = os.getenv("SERVE_WORKERS", "2")
+# where native workers write their metric samples for /metrics to merge
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus")
 
 mlflow.set_tracking_uri(f"http://mlflow-tracking:{MLFLOW_PORT}")
 logger.info(f"Tracking URI set to: http://mlflow-tracking:{MLFLOW_PORT}")
@@ -48,5 +56,30 @@ def serve_model():
         logger.error(f"Failed to serve model: {e}")
 
 
+def serve_native():
+    logger.info(
+        f"Serving model {MODEL_NAME} version {MODEL_VERSION} in-process with "
+        f"{SERVE_WORKERS} workers on port {MODEL_API_PORT}")
+    # samples of a previous run would otherwise be added to the new ones
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR)
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.getcwd()
+    env["PROMETHEUS_MULTIPROC_DIR"] = PROMETHEUS_MULTIPROC_DIR
+    env.setdefault("MLFLOW_TRACKING_URI", f"http://mlflow-tracking:{MLFLOW_PORT}")
+    try:
+        subprocess.run([
+            "uvicorn", "native_serve:app",
+            "--host", "0.0.0.0",
+            "--port", MODEL_API_PORT,
+            "--workers", SERVE_WORKERS
+        ], env=env, check=True)
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Failed to serve model: {e}")
+
+
 if __name__ == "__main__":
-    serve_model()
+    if SERVE_MODE == "mlflow":
+        serve_model()
+    else:
+        serve_native()
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import time
+from prometheus_client import Histogram
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+WAIT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+# Prometheus metrics
+BATCH_SIZE = Histogram("proxy_batch_size",
+                       "Texts per model server invocation", buckets=BATCH_BUCKETS)
+BATCH_REQUESTS = Histogram("proxy_batch_requests",
+                           "Client requests coalesced into one invocation",
+                           buckets=BATCH_BUCKETS)
+QUEUE_WAIT = Histogram("proxy_queue_wait_seconds",
+                       "Time a request waits before its batch is sent", buckets=WAIT_BUCKETS)
+
+
+class MicroBatcher:
+    """Coalesce concurrent prediction requests into shared model invocations.
+
+    A batch is sent once it holds `max_batch_size` texts or its first request
+    has waited `max_wait` seconds. While `max_in_flight` batches are already
+    at the model server the next batch keeps filling, so batches grow with
+    load. A request larger than `max_batch_size` is sent on its own.
+    `invoke(texts)` is the coroutine that calls the model server and returns
+    one prediction per text.
+    """
+
+    def __init__(self, invoke, max_batch_size, max_wait, max_in_flight):
+        self.invoke = invoke
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._queue = asyncio.Queue()
+        self._task = None
+        self._in_flight = set()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, *self._in_flight, return_exceptions=True)
+
+    async def predict(self, texts):
+        """Predictions for `texts`, sent to the model with other callers' texts"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((texts, future, time.perf_counter()))
+        return await future
+
+    async def _get(self, timeout):
+        """Next queued request, or None if none arrives within `timeout` seconds"""
+        if not self._queue.empty():
+            return self._queue.get_nowait()
+        if timeout <= 0:
+            return None
+        getter = asyncio.ensure_future(self._queue.get())
+        done, _ = await asyncio.wait({getter}, timeout=timeout)
+        if not done:
+            getter.cancel()
+            # the get may have finished before the cancel took effect
+            await asyncio.wait({getter})
+        return None if getter.cancelled() else getter.result()
+
+    async def _fill(self, batch, deadline):
+        """Add requests to `batch` until it is full, waiting for more until
+        `deadline` if given, otherwise taking only the queued ones.
+        Returns a request that did not fit, if any."""
+        loop = asyncio.get_running_loop()
+        size = sum(len(texts) for texts, _, _ in batch)
+        while size < self.max_batch_size:
+            item = await self._get(deadline - loop.time() if deadline is not None else 0)
+            if item is None:
+                return None
+            if size + len(item[0]) > self.max_batch_size:
+                return item
+            batch.append(item)
+            size += len(item[0])
+        return None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        carried = None
+        while True:
+            batch = [carried or await self._queue.get()]
+            carried = await self._fill(batch, loop.time() + self.max_wait)
+            await self._slots.acquire()
+            if carried is None:
+                # requests that arrived while every invocation slot was busy
+                carried = await self._fill(batch, None)
+            task = asyncio.create_task(self._send(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _send(self, batch):
+        try:
+            now = time.perf_counter()
+            for _, _, enqueued in batch:
+                QUEUE_WAIT.observe(now - enqueued)
+            texts = [text for item_texts, _, _ in batch for text in item_texts]
+            BATCH_SIZE.observe(len(texts))
+            BATCH_REQUESTS.observe(len(batch))
+            try:
+                preds = await self.invoke(texts)
+                if len(preds) != len(texts):
+                    raise ValueError(f"{len(preds)} predictions for {len(texts)} texts")
+            except Exception as e:
+                logger.error(f"Invocation for {len(batch)} requests failed: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            start = 0
+            for item_texts, future, _ in batch:
+                if not future.done():
+                    future.set_result(preds[start:start + len(item_texts)])
+                start += len(item_texts)
+        finally:
+            self._slots.release()
@@ -0,0 +1,80 @@
+"""Requests/sec of the model proxy against the number of concurrent clients.
+
+Each client sends /predict requests shaped like the rss_reader's, one after
+the other, for a fixed time, and the run reports throughput and latency per
+concurrency level. Run it against a started docker-compose.dev.yaml stack;
+with a blocking upstream call throughput stays flat as clients are added,
+with the pooled async client and batching it should grow until the model
+server is saturated.
+
+    python bench_proxy.py [--url http://localhost:8000/predict] [--clients 1 4 16 64]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+
+
+def make_titles(client, request, size):
+    return [f"Headline {client}-{request}-{i} about markets, politics and sport"
+            for i in range(size)]
+
+
+async def run_client(http, url, client, size, stop_at, latencies):
+    """Send requests until stop_at, returns the number of failed ones"""
+    errors = 0
+    request = 0
+    while time.perf_counter() < stop_at:
+        titles = make_titles(client, request, size)
+        start = time.perf_counter()
+        try:
+            response = await http.post(url, json={"instances": [{"text": titles}]})
+            response.raise_for_status()
+            if len(response.json()["predictions"]) != size:
+                raise ValueError("wrong number of predictions")
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            errors += 1
+        request += 1
+    return errors
+
+
+async def run(url, clients, size, duration):
+    """(requests/sec, p50 ms, p99 ms, errors) with `clients` concurrent clients"""
+    latencies = []
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(timeout=60, limits=limits) as http:
+        stop_at = time.perf_counter() + duration
+        start = time.perf_counter()
+        errors = await asyncio.gather(*[run_client(http, url, client, size, stop_at, latencies)
+                                        for client in range(clients)])
+        elapsed = time.perf_counter() - start
+    if len(latencies) < 2:
+        return 0, 0, 0, sum(errors)
+    p99 = statistics.quantiles(latencies, n=100)[98]
+    return (len(latencies) / elapsed, statistics.median(latencies) * 1000, p99 * 1000,
+            sum(errors))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000/predict")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--titles", type=int, default=8, help="titles per request")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per level")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.url, 1, args.titles, 1))  # warm-up
+    print(f"{'clients':>8}{'req/sec':>10}{'titles/sec':>12}{'scaling':>9}{'p50 ms':>9}{'p99 ms':>9}"
+          f"{'errors':>8}")
+    base_rate = None
+    for clients in args.clients:
+        rate, p50, p99, errors = asyncio.run(run(args.url, clients, args.titles, args.duration))
+        base_rate = base_rate or rate
+        print(f"{clients:>8}{rate:>10,.0f}{rate * args.titles:>12,.0f}{rate / base_rate:>8.1f}x"
+              f"{p50:>9.1f}{p99:>9.1f}{errors:>8}")
+
+
+if __name__ == "__main__":
+    main()
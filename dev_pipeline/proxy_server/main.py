@@ -1,12 +1,13 @@
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse, Response
 from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
-import requests
-import time
+from contextlib import asynccontextmanager
+import httpx
 import logging
 import os
-
-app = FastAPI()
+from batcher import MicroBatcher
+from prediction_cache import PredictionCache
+import metrics_middleware
 
 # Set up logging
 log_dir = "/app/logs"
@@ -32,27 +33,141 @@ REQUEST_ERRORS = Counter("model_request_errors_total",
                          "Number of failed requests")
 
 MLFLOW_INVOCATION_URL = "http://mlflow-model:5001/invocations"
+# registered version of NewsSentiment the mlflow-model service serves, clients
+# key cached predictions on it
+MODEL_NAME = "NewsSentiment"
+MODEL_VERSION = os.getenv("MODEL_VERSION", "1")
+MODEL_VERSION_HEADERS = {"X-Model-Version": f"{MODEL_NAME}/{MODEL_VERSION}"}
+# "true" coalesces concurrent /predict requests into shared model invocations
+PROXY_BATCHING = os.getenv("PROXY_BATCHING", "true").lower() == "true"
+# most texts per invocation, and how long a request waits for others to join
+PROXY_MAX_BATCH_SIZE = int(os.getenv("PROXY_MAX_BATCH_SIZE", "64"))
+PROXY_MAX_WAIT_MS = float(os.getenv("PROXY_MAX_WAIT_MS", "5"))
+# invocations in flight at once, later requests queue into the next batch
+PROXY_MAX_IN_FLIGHT = int(os.getenv("PROXY_MAX_IN_FLIGHT", "2"))
+# seconds to connect to the model server and to wait for each read from it
+PROXY_CONNECT_TIMEOUT = float(os.getenv("PROXY_CONNECT_TIMEOUT", "3"))
+PROXY_TIMEOUT = float(os.getenv("PROXY_TIMEOUT", "30"))
+# pooled connections to the model server, and how many stay open idle and for how long
+PROXY_MAX_CONNECTIONS = int(os.getenv("PROXY_MAX_CONNECTIONS", "32"))
+PROXY_MAX_KEEPALIVE = int(os.getenv("PROXY_MAX_KEEPALIVE", "16"))
+PROXY_KEEPALIVE_EXPIRY = float(os.getenv("PROXY_KEEPALIVE_EXPIRY", "30"))
+# retries of a failed connection attempt, requests that reached the model are not retried
+PROXY_CONNECT_RETRIES = int(os.getenv("PROXY_CONNECT_RETRIES", "1"))
+# predictions kept in memory per text, least recently used beyond this are
+# evicted, 0 disables the cache
+PROXY_CACHE_MAX_ENTRIES = int(os.getenv("PROXY_CACHE_MAX_ENTRIES", "100000"))
+# seconds a cached prediction is served before the text goes to the model again
+PROXY_CACHE_TTL = float(os.getenv("PROXY_CACHE_TTL", "3600"))
+
+PREDICTION_CACHE = PredictionCache(PROXY_CACHE_MAX_ENTRIES, PROXY_CACHE_TTL)
+
+
+def make_upstream():
+    """Pooled keep-alive client for the model server"""
+    # httpx ignores the client's limits when given a transport, so the pool
+    # is sized on the transport itself
+    limits = httpx.Limits(max_connections=PROXY_MAX_CONNECTIONS,
+                          max_keepalive_connections=PROXY_MAX_KEEPALIVE,
+                          keepalive_expiry=PROXY_KEEPALIVE_EXPIRY)
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(PROXY_TIMEOUT, connect=PROXY_CONNECT_TIMEOUT),
+        transport=httpx.AsyncHTTPTransport(retries=PROXY_CONNECT_RETRIES, limits=limits))
+
+
+async def invoke(texts):
+    """One model server invocation for a list of texts"""
+    response = await app.state.upstream.post(MLFLOW_INVOCATION_URL,
+                                             json={"instances": [{"text": texts}]})
+    response.raise_for_status()
+    return response.json()["predictions"]
+
+
+async def predict_texts(texts):
+    """Predictions for texts, from the cache where possible and from the
+    model for the rest, batched with other requests if batching is on"""
+    version = MODEL_VERSION_HEADERS["X-Model-Version"]
+    preds = PREDICTION_CACHE.get_many(texts, version)
+    misses = list(dict.fromkeys(text for text in texts if text not in preds))
+    if misses:
+        batcher = app.state.batcher
+        miss_preds = await (batcher.predict(misses) if batcher is not None else invoke(misses))
+        if len(miss_preds) != len(misses):
+            raise ValueError(f"{len(miss_preds)} predictions for {len(misses)} texts")
+        PREDICTION_CACHE.put_many(zip(misses, miss_preds), version)
+        preds.update(zip(misses, miss_preds))
+    return [preds[text] for text in texts]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.upstream = make_upstream()
+    app.state.batcher = None
+    if PROXY_BATCHING:
+        app.state.batcher = MicroBatcher(invoke, PROXY_MAX_BATCH_SIZE,
+                                         PROXY_MAX_WAIT_MS / 1000, PROXY_MAX_IN_FLIGHT)
+        app.state.batcher.start()
+    yield
+    if app.state.batcher is not None:
+        await app.state.batcher.stop()
+    await app.state.upstream.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def record_request(route, status, elapsed):
+    """Feed the model_* metrics for /predict from the metrics middleware"""
+    if route != "/predict":
+        return
+    REQUEST_COUNT.inc()
+    REQUEST_LATENCY.observe(elapsed)
+    if status >= 400:
+        REQUEST_ERRORS.inc()
+    logger.info(f"Request latency: {elapsed:.4f} seconds")
+
+
+app.add_middleware(metrics_middleware.PrometheusMiddleware,
+                   on_response=record_request)
+
+
+def batchable_texts(payload):
+    """Texts of a {"instances": [{"text": [...]}]} request, the shape the
+    rss_reader sends, or None for any other payload. Only lists of strings
+    qualify: the model server rejects a whole invocation over one bad text,
+    which would fail every request batched with it."""
+    instances = payload.get("instances") if isinstance(payload, dict) else None
+    if (isinstance(instances, list) and len(instances) == 1
+            and isinstance(instances[0], dict) and isinstance(instances[0].get("text"), list)
+            and all(isinstance(text, str) for text in instances[0]["text"])):
+        return instances[0]["text"]
+    return None
 
 
 @app.post("/predict")
 async def predict(request: Request):
-    REQUEST_COUNT.inc()
-    start_time = time.time()
     try:
         input_data = await request.json()
         logger.info(f"Received prediction request: {input_data}")
-        response = requests.post(MLFLOW_INVOCATION_URL, json=input_data)
+        texts = batchable_texts(input_data)
+        if texts is not None and (request.app.state.batcher is not None
+                                  or PREDICTION_CACHE.max_entries):
+            preds = await predict_texts(texts) if texts else []
+            return JSONResponse(content={"predictions": preds}, headers=MODEL_VERSION_HEADERS)
+        # anything else is passed through unbatched
+        response = await request.app.state.upstream.post(MLFLOW_INVOCATION_URL, json=input_data)
         response.raise_for_status()
         logger.info("Successfully received response from MLflow model.")
-        return Response(content=response.content, media_type=response.headers.get('Content-Type'))
+        return Response(content=response.content, media_type=response.headers.get('Content-Type'),
+                        headers=MODEL_VERSION_HEADERS)
     except Exception as e:
         logger.error(f"Prediction request failed: {e}")
-        REQUEST_ERRORS.inc()
         return JSONResponse(status_code=500, content={"error": str(e)})
-    finally:
-        latency = time.time() - start_time
-        REQUEST_LATENCY.observe(latency)
-        logger.info(f"Request latency: {latency:.4f} seconds")
+
+
+@app.get("/version")
+def version():
+    return {"model": MODEL_NAME, "version": MODEL_VERSION_HEADERS["X-Model-Version"]}
 
 
 @app.get("/metrics")
@@ -0,0 +1,94 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from prometheus_client import Counter, Gauge
+
+
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics
+CACHE_LOOKUPS = Counter("proxy_cache_lookups_total",
+                        "Texts looked up in the prediction cache by result (hit, miss)",
+                        ["result"])
+CACHE_EVICTIONS = Counter("proxy_cache_evictions_total",
+                          "Cached predictions dropped by reason (lru, expired, version)",
+                          ["reason"])
+CACHE_ENTRIES = Gauge("proxy_cache_entries", "Predictions held in the prediction cache")
+CACHE_HIT_RATIO = Gauge("proxy_cache_hit_ratio",
+                        "Share of looked up texts found in the cache since start")
+
+
+def text_key(text):
+    """sha256 of the text as the uncased tokenizer sees it"""
+    return hashlib.sha256(" ".join(text.split()).lower().encode("utf-8")).digest()
+
+
+class PredictionCache:
+    """In-memory predictions by text hash for one model version.
+
+    Holds at most `max_entries` predictions, evicting the least recently used
+    first, and treats an entry older than `ttl` seconds as a miss. Entries of
+    any other model version are dropped as soon as a different version is
+    seen. `max_entries=0` disables the cache.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = None
+        self._entries = OrderedDict()  # key -> (expires, prediction), oldest use first
+        self._hits = 0
+        self._lookups = 0
+        CACHE_ENTRIES.set_function(lambda: len(self._entries))
+        CACHE_HIT_RATIO.set_function(lambda: self._hits / self._lookups if self._lookups else 0)
+
+    def _use_version(self, version):
+        if version == self.version:
+            return
+        if self._entries:
+            CACHE_EVICTIONS.labels(reason="version").inc(len(self._entries))
+            logger.info(f"Model version is now {version}, "
+                        f"dropped {len(self._entries)} cached predictions.")
+            self._entries.clear()
+        self.version = version
+
+    def get_many(self, texts, version):
+        """Cached predictions of `version` for the texts that have one, by text"""
+        if not self.max_entries or not texts:
+            return {}
+        self._use_version(version)
+        now = time.monotonic()
+        hits = {}
+        for text in texts:
+            key = text_key(text)
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            expires, prediction = entry
+            if expires <= now:
+                del self._entries[key]
+                CACHE_EVICTIONS.labels(reason="expired").inc()
+                continue
+            self._entries.move_to_end(key)
+            hits[text] = prediction
+        hit_count = sum(1 for text in texts if text in hits)
+        self._hits += hit_count
+        self._lookups += len(texts)
+        CACHE_LOOKUPS.labels(result="hit").inc(hit_count)
+        CACHE_LOOKUPS.labels(result="miss").inc(len(texts) - hit_count)
+        return hits
+
+    def put_many(self, pairs, version):
+        """Store (text, prediction) pairs made by `version` and evict down to max_entries"""
+        if not self.max_entries:
+            return
+        self._use_version(version)
+        expires = time.monotonic() + self.ttl
+        for text, prediction in pairs:
+            key = text_key(text)
+            self._entries[key] = (expires, prediction)
+            self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            CACHE_EVICTIONS.labels(reason="lru").inc()
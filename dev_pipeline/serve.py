@@ -9,7 +9,7 @@ load_dotenv()
 MLFLOW_PORT = os.getenv("MLFLOW_PORT", "5000")
 MODEL_API_PORT = os.getenv("MLFLOW_API_PORT", "5001")
 MODEL_NAME = "NewsSentiment"
-MODEL_VERSION = 1
+MODEL_VERSION = os.getenv("MODEL_VERSION", "1")
 mlflow.set_tracking_uri(f"http://localhost:{MLFLOW_PORT}")
 print(f"Tracking URI set to: http://localhost:{MLFLOW_PORT}")
 